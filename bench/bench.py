@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Benchmarks tinydns-data.py on data files made by gendata.py, in several
+# modes (plain, --text, --jobs, --cache, --lint, --split-locations and
+# --shards), reporting for each the time taken, lines per second, the peak
+# memory of the process and the size of the output.
+#
+# With --save, the results are stored as the baseline (bench/baseline.json
+# by default); later runs are compared against it, and exit with status 1 if
+# a mode got slower or bigger by more than --tolerance, or its output size
+# changed. Baselines only make sense on the machine they were made on.
+
+import sys
+import os
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import gendata
+
+here = os.path.dirname(os.path.abspath(__file__))
+script = os.path.join(os.path.dirname(here), 'tinydns-data.py')
+
+def modeArguments(jobs):
+    """Arguments to tinydns-data.py for each mode. The cache modes run with
+    the same cache file, cold (new) and then warm.
+    """
+    return {
+        'cdb': [],
+        'text': ['--text'],
+        'jobs': ['-j', str(jobs)],
+        'cache-cold': ['--cache', 'cache'],
+        'cache-warm': ['--cache', 'cache'],
+        'lint': ['--lint'],
+        'split': ['--split-locations'],
+        'shards': ['--shards', '8'],
+        }
+
+def directorySize(path, skip=()):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name not in skip)
+
+def runMode(mode, arguments, data, workdir):
+    """Run tinydns-data.py in workdir (where the outputs go), returning the
+    seconds taken and the peak memory of the process in KiB
+    """
+    command = [sys.executable, script, '-o', 'data.cdb'] + arguments + [data]
+    with open(os.path.join(workdir, 'stdout'), 'wb') as stdout:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, stdout=stdout)
+        # wait4 rather than process.wait() for the child's own peak memory;
+        # then Popen needs telling it's done (as it would have set it)
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+    if os.WIFSIGNALED(status):
+        code = -os.WTERMSIG(status)
+    else:
+        code = os.WEXITSTATUS(status)
+    process.returncode = code
+    # --lint exits with 1 for problems, which are fine here
+    if code != 0 and not (mode == 'lint' and code == 1):
+        raise Exception("{} failed with status {}: {}".format(mode, code, ' '.join(command)))
+    peak = usage.ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return seconds, peak
+
+def benchmark(lines, modes, args, workdir):
+    """Generate a data file of lines lines and run each mode on it, best of
+    args.repeat runs. Returns {mode: results}.
+    """
+    data = os.path.abspath(os.path.join(workdir, 'data{}'.format(lines)))
+    with open(data, 'w', buffering=1 << 20) as out:
+        gendata.generate(out, lines, gendata.parseMix(args.mix), args.seed, args.txt_length)
+    arguments = modeArguments(args.jobs)
+    results = {}
+    for mode in modes:
+        modedir = os.path.join(workdir, 'cache' if mode.startswith('cache') else mode)
+        if mode != 'cache-warm':
+            shutil.rmtree(modedir, ignore_errors=True)
+            os.mkdir(modedir)
+        best = None
+        for i in range(args.repeat):
+            if mode == 'cache-cold' and os.path.exists(os.path.join(modedir, 'cache')):
+                os.unlink(os.path.join(modedir, 'cache'))
+            seconds, peak = runMode(mode, arguments[mode], data, modedir)
+            if best is None or seconds < best[0]:
+                best = (seconds, peak)
+        seconds, peak = best
+        results[mode] = {
+            'seconds': seconds,
+            'lines_per_second': lines / seconds,
+            'peak_rss_kib': peak,
+            'output_bytes': directorySize(modedir, skip=('cache',)),
+            }
+        print("{:>9} {:<10} {:>8.3f}s {:>10.0f} lines/s {:>8.1f} MiB {:>12} bytes".format(
+            lines, mode, seconds, lines / seconds, peak / 1024, results[mode]['output_bytes']), flush=True)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against baseline, as messages"""
+    regressions = []
+    for lines, modes in results.items():
+        for mode, result in modes.items():
+            base = baseline.get(lines, {}).get(mode)
+            if base is None:
+                continue
+            for measure in ('seconds', 'peak_rss_kib'):
+                if result[measure] > base[measure] * (1 + tolerance):
+                    regressions.append("{} lines, {}: {} went from {:.6g} to {:.6g} (+{:.0%})".format(
+                        lines, mode, measure, base[measure], result[measure],
+                        result[measure] / base[measure] - 1))
+            if result['output_bytes'] != base['output_bytes']:
+                regressions.append("{} lines, {}: output size went from {} to {} bytes".format(
+                    lines, mode, base['output_bytes'], result['output_bytes']))
+    return regressions
+
+def main():
+    modes = list(modeArguments(1))
+    parser = argparse.ArgumentParser(description="Benchmark tinydns-data.py on generated data files")
+    parser.add_argument('-n', '--lines', type=int, action='append',
+            help="size of data file to benchmark, in lines; may be given more than once (default: 10000 and 100000)")
+    parser.add_argument('-m', '--mode', action='append', choices=modes,
+            help="mode to run; may be given more than once (default: all)")
+    parser.add_argument('--seed', type=int, default=1,
+            help="seed for gendata.py (default: %(default)s)")
+    parser.add_argument('--mix', default=gendata.default_mix,
+            help="mix of line types for gendata.py (default: %(default)s)")
+    parser.add_argument('--txt-length', type=int, default=1000,
+            help="longest TXT text for gendata.py, in characters (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=min(4, os.cpu_count() or 1),
+            help="processes for the 'jobs' mode (default: %(default)s)")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+            help="run each mode this many times, keeping the fastest (default: %(default)s)")
+    parser.add_argument('--baseline', default=os.path.join(here, 'baseline.json'),
+            help="results to compare against (default: %(default)s)")
+    parser.add_argument('--save', action='store_true',
+            help="store the results as the baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+            help="how much slower or bigger than the baseline is a regression, as a fraction (default: %(default)s)")
+    parser.add_argument('--workdir',
+            help="directory for the data files and outputs, which are kept (default: a temporary directory)")
+    args = parser.parse_args()
+    try:
+        gendata.parseMix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    sizes = args.lines or [10000, 100000]
+    selected = [mode for mode in modes if args.mode is None or mode in args.mode]
+    if 'cache-warm' in selected and 'cache-cold' not in selected:
+        selected.insert(selected.index('cache-warm'), 'cache-cold')
+
+    tmp = None
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        workdir = args.workdir
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix='tinydns-bench-')
+        workdir = tmp.name
+    results = {}
+    try:
+        for lines in sizes:
+            results[str(lines)] = benchmark(lines, selected, args, workdir)
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print("Saved baseline to {}".format(args.baseline))
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("No baseline to compare with ({}); use --save to make one".format(args.baseline))
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("Regression: " + regression)
+    if not regressions:
+        print("No regressions against {}".format(args.baseline))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
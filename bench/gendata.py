@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# Writes a synthetic tinydns 'data' file for benchmarking. The same seed,
+# number of lines and mix always give the same file.
+#
+# The file starts with a '.' line for each zone (one per 1000 lines), and
+# the rest of the lines are picked at random by the weights of the mix, e.g.
+# '=:35,+:15,/:2' for mostly '=' lines with a few '/' sub-delegations. Hosts
+# get addresses counting up from 10.0.0.0, so '=' lines don't repeat each
+# other, and '/' lines delegate part of a /24 about to be handed out (one
+# per /24, so they don't overlap).
+
+import sys
+import random
+import argparse
+
+default_mix = "+:15,=:35,6:10,&:3,@:5,':10,S:4,V:3,H:5,/:2,%:0.5"
+
+def parseMix(text):
+    """Parse a mix like '+:15,=:35' into {line type: weight}"""
+    mix = {}
+    for part in text.split(','):
+        rtype, sep, weight = part.rpartition(':')
+        if len(rtype) != 1 or not sep:
+            raise ValueError("Bad mix entry {!r} (should be like '=:35')".format(part))
+        if rtype not in generators:
+            raise ValueError("Can't generate {!r} lines".format(rtype))
+        mix[rtype] = float(weight)
+    return mix
+
+class Generator:
+    """Makes up data lines, drawing everything from a seeded random.Random"""
+    def __init__(self, lines, seed=1, txt_length=1000):
+        self.random = random.Random(seed)
+        self.zones = ["zone{}.example".format(i) for i in range(max(1, lines // 1000))]
+        self.txt_length = txt_length
+        self.hosts = 0
+        self.locations = []
+        # The /24s given to '/' lines, so they don't overlap
+        self.blocks = set()
+
+    def address(self):
+        """A new IPv4 address, never handed out before"""
+        n = self.hosts
+        self.hosts += 1
+        return "{}.{}.{}.{}".format(*self.octets(n))
+
+    def usedAddress(self):
+        """An address (or at least a /24) handed out before, if any were"""
+        return self.octets(self.random.randrange(max(1, self.hosts)))
+
+    def comingBlock(self):
+        """A /24 that will soon be handed out, and hasn't been picked before"""
+        block = (self.hosts >> 8) + self.random.randrange(1, 16)
+        while block in self.blocks:
+            block += 1
+        self.blocks.add(block)
+        return self.octets(block << 8)
+
+    def octets(self, n):
+        return (10 + (n >> 24), (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff)
+
+    def zone(self):
+        return self.random.choice(self.zones)
+
+    def host(self):
+        return "host{}.{}".format(self.random.randrange(1 << 30), self.zone())
+
+    def ttl(self):
+        return self.random.choice(("", "", "300", "3600"))
+
+    def loc(self):
+        if self.locations and self.random.random() < 0.05:
+            return ":::" + self.random.choice(self.locations)
+        return ""
+
+    def text(self):
+        # Mostly short texts, with some long enough to need splitting, and
+        # escapes like real ones (':' must be escaped)
+        if self.random.random() < 0.2:
+            length = self.random.randrange(128, max(129, self.txt_length + 1))
+        else:
+            length = self.random.randrange(1, 100)
+        words = []
+        size = 0
+        while size < length:
+            word = self.random.choice(("v=spf1", "include\\072spf.example", "~all", "key=",
+                    "abcdefghijklmnop", "\\040", "site-verification", "0123456789"))
+            words.append(word)
+            size += len(word) + 1
+        return ' '.join(words)
+
+    def line(self, rtype):
+        return generators[rtype](self)
+
+def genAddress(g):
+    return "+{}:{}:{}".format(g.host(), g.address(), g.ttl()) + g.loc()
+
+def genAddressWithPtr(g):
+    return "={}:{}:{}".format(g.host(), g.address(), g.ttl()) + g.loc()
+
+def genAddress6(g):
+    return "6{}:{:032x}:{}".format(g.host(), (0x20010db8 << 96) | g.random.randrange(1 << 64), g.ttl())
+
+def genNs(g):
+    zone = g.zone()
+    return "&{}:{}:ns{}.{}".format(zone, g.address(), g.random.randrange(1 << 30), zone)
+
+def genMx(g):
+    zone = g.zone()
+    return "@{}:{}:mx{}.{}:{}".format(zone, g.address(), g.random.randrange(1 << 30), zone,
+            g.random.choice((10, 20, 30)))
+
+def genTxt(g):
+    return "'{}:{}:{}".format(g.host(), g.text(), g.ttl())
+
+def genSrv(g):
+    zone = g.zone()
+    return "S_{}._tcp.{}:{}:{}:{}:{}:{}".format(g.random.choice(("sip", "xmpp", "ldap")), zone,
+            g.address(), g.host(), g.random.randrange(1, 65536), g.random.randrange(10), g.random.randrange(100))
+
+def genSvcb(g):
+    return "V_{}._svc.{}:{}:1:alpn=h2,h3 port={}".format(g.random.randrange(1000), g.zone(), g.host(),
+            g.random.randrange(1, 65536))
+
+def genHttps(g):
+    zone = g.zone()
+    if g.random.random() < 0.3:
+        return "H{}:{}:0".format(zone, g.host())
+    return "Hwww{}.{}:.:1:alpn=h2,h3 ipv4hint={}".format(g.random.randrange(1000), zone, g.address())
+
+def genSubDelegation(g):
+    # Part of a /24 about to be handed out, RFC2317 style, with the CNAMEs
+    # and NS record
+    a, b, c, d = g.comingBlock()
+    prefix = g.random.randrange(25, 32)
+    start = g.random.randrange(1 << (prefix - 24)) << (32 - prefix)
+    zone = g.zone()
+    return "/{}-{}.{}.{}.{}.in-addr.arpa:{}.{}.{}.{}/{}:ns.{}:{}".format(start, prefix, c, b, a,
+            a, b, c, start, prefix, zone, g.address())
+
+def genLocation(g):
+    if len(g.locations) < 16 and (not g.locations or g.random.random() < 0.5):
+        g.locations.append("l{:x}".format(len(g.locations)))
+    a, b, c, d = g.usedAddress()
+    return "%{}:{}.{}.{}".format(g.random.choice(g.locations), a, b, c)
+
+generators = {
+    '+': genAddress,
+    '=': genAddressWithPtr,
+    '6': genAddress6,
+    '&': genNs,
+    '@': genMx,
+    "'": genTxt,
+    'S': genSrv,
+    'V': genSvcb,
+    'H': genHttps,
+    '/': genSubDelegation,
+    '%': genLocation,
+    }
+
+def generate(out, lines, mix, seed=1, txt_length=1000):
+    """Write lines data lines to the stream out"""
+    g = Generator(lines, seed, txt_length)
+    count = 0
+    for zone in g.zones:
+        if count == lines:
+            return
+        out.write(".{}:{}:a\n".format(zone, g.address()))
+        count += 1
+    types = list(mix)
+    weights = [mix[rtype] for rtype in types]
+    while count < lines:
+        # Drawing a batch at a time is much faster than one by one
+        for rtype in g.random.choices(types, weights, k=min(10000, lines - count)):
+            out.write(g.line(rtype))
+            out.write('\n')
+        count += min(10000, lines - count)
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic tinydns data file for benchmarking")
+    parser.add_argument('-n', '--lines', type=int, default=100000,
+            help="number of lines (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=1,
+            help="seed for the random choices; the same seed gives the same file (default: %(default)s)")
+    parser.add_argument('--mix', default=default_mix,
+            help="relative weights of the line types, as TYPE:WEIGHT,... (default: %(default)s)")
+    parser.add_argument('--txt-length', type=int, default=1000,
+            help="longest TXT text, in characters (default: %(default)s)")
+    parser.add_argument('-o', '--output', default='-',
+            help="file to write (default: stdout)")
+    args = parser.parse_args()
+    try:
+        mix = parseMix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.output == '-':
+        generate(sys.stdout, args.lines, mix, args.seed, args.txt_length)
+    else:
+        with open(args.output, 'w', buffering=1 << 20) as out:
+            generate(out, args.lines, mix, args.seed, args.txt_length)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Shows which DNS records differ between two builds. Each input is either a
+# data file, which is compiled, or a cdb file (its name ending in '.cdb').
+#
+# Records only in the old input are printed with '-', records only in the new
+# one with '+', in the format of tinydns-get.py. By default the two are
+# merged in order of owner name and type; with --ixfr all removals come
+# before all additions, as in an incremental zone transfer. Exits with
+# status 1 if there are differences, like diff.
+
+import sys
+import argparse
+
+import tinydns_data
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the records of two tinydns data files or cdb databases")
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--serial', type=int,
+            help="SOA serial to use for both data files where a line doesn't give one (default: each file's timestamp)")
+    parser.add_argument('--ixfr', action='store_true',
+            help="print all removed records before all added ones")
+    parser.add_argument('--summary', action='store_true',
+            help="only print the number of records removed and added")
+    args = parser.parse_args()
+
+    def readOld():
+        return tinydns_data.recordsFromFile(args.old, args.serial)
+    def readNew():
+        return tinydns_data.recordsFromFile(args.new, args.serial)
+    try:
+        removed, added = tinydns_data.diffRecords(readOld, readNew)
+    except Exception as e:
+        if hasattr(e, 'lineno'):
+            print("Error encountered while processing {}:".format(tinydns_data.describeErrorLocation(e)), file=sys.stderr)
+        raise
+
+    if args.summary:
+        print("{} removed, {} added".format(len(removed), len(added)))
+    elif args.ixfr:
+        for sign, records in (('-', removed), ('+', added)):
+            for key, value in records:
+                print(sign + tinydns_data.describeRecord(key, value))
+    else:
+        changes = [(tinydns_data.recordSortKey(record), 0, '-', record) for record in removed]
+        changes += [(tinydns_data.recordSortKey(record), 1, '+', record) for record in added]
+        changes.sort(key=lambda change: change[:2])
+        for _, _, sign, (key, value) in changes:
+            print(sign + tinydns_data.describeRecord(key, value))
+    return 1 if removed or added else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# Looks up names in a tinydns cdb database (as made by tinydns-data.py), or a
+# snapshot (a file ending in '.snap', see tinydns-data.py --snapshot), and
+# prints their records, one per line: name, type, TTL, TTD (hex), location
+# ('-' for none) and data.
+#
+# With --names, checks every name listed in a file (one per line, optionally
+# followed by a type) in one pass, printing the ones without records, and
+# exits with status 1 if there were any.
+
+import sys
+import argparse
+
+import tinydns_data
+
+def parseQuery(text):
+    parts = text.split()
+    name = parts[0]
+    type_ = None
+    if len(parts) > 1:
+        type_ = tinydns_data.rrTypeNumber(parts[1])
+    return name, type_
+
+def lookup(reader, name, type_=None):
+    """Yield the (key, value) records for name, only those of the given type
+    if there is one
+    """
+    key = tinydns_data.name_to_dns(name)
+    for value in reader.get(key):
+        if type_ is None or tinydns_data.U16.unpack_from(value)[0] == type_:
+            yield key, value
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up names in a tinydns cdb database")
+    parser.add_argument('-f', '--file', default='data.cdb',
+            help="cdb file (or snapshot, ending in '.snap') to read (default: %(default)s)")
+    parser.add_argument('-t', '--type',
+            help="only show records of this type (e.g. MX, or a number)")
+    parser.add_argument('--names', metavar='FILE',
+            help="check every name in FILE ('-' for stdin), one per line optionally followed by a type")
+    parser.add_argument('--dump', action='store_true',
+            help="print every record in the database")
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help="with --names, also print the records found")
+    parser.add_argument('name', nargs='*')
+    args = parser.parse_args()
+
+    def fail(message):
+        parser.exit(1, "{}: error: {}\n".format(parser.prog, message))
+
+    out = sys.stdout
+    try:
+        reader = tinydns_data.openDatabase(args.file)
+    except OSError as e:
+        fail(tinydns_data.osErrorMessage(e))
+    except Exception as e:
+        # Not a cdb file (or snapshot)
+        fail(e)
+    with reader:
+        if args.dump:
+            for key, value in reader:
+                print(tinydns_data.describeRecord(key, value), file=out)
+            return 0
+
+        if args.names:
+            try:
+                names = sys.stdin if args.names == '-' else open(args.names)
+            except OSError as e:
+                fail(tinydns_data.osErrorMessage(e))
+            checked = missing = 0
+            with names:
+                for line in names:
+                    line = line.strip()
+                    if len(line) == 0 or line[0] == '#':
+                        continue
+                    name, type_ = parseQuery(line)
+                    checked += 1
+                    found = False
+                    for key, value in lookup(reader, name, type_):
+                        found = True
+                        if args.verbose:
+                            print(tinydns_data.describeRecord(key, value), file=out)
+                        else:
+                            break
+                    if not found:
+                        missing += 1
+                        print("{}: no records".format(line), file=out)
+            print("{} names checked, {} without records".format(checked, missing), file=sys.stderr)
+            return 1 if missing else 0
+
+        type_ = tinydns_data.rrTypeNumber(args.type) if args.type else None
+        status = 0
+        for name in args.name:
+            found = False
+            for key, value in lookup(reader, name, type_):
+                found = True
+                print(tinydns_data.describeRecord(key, value), file=out)
+            if not found:
+                print("{}: no records".format(name), file=sys.stderr)
+                status = 1
+        return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,653 @@
+#!/usr/bin/env python3
+# Answers DNS queries (UDP and TCP) from the records of a tinydns database,
+# snapshot or data files, roughly as tinydns would, for trying out and
+# load-testing data before it's deployed. Not meant to face the internet.
+#
+# Answers are authoritative for names under an SOA, with referrals for names
+# delegated by NS records, wildcards ('*' names), names compressed in the
+# usual places, records restricted to the client's location ('%' lines) and
+# records with a TTD handled like tinydns does. Answers to repeated queries
+# come from a small cache.
+#
+# With --replay, sends queries (the names, and a type, from a file, or every
+# name and type in the data) to a server as fast as it answers, and reports
+# the queries per second and latency. Without --server, it starts a
+# responder for the data in another process and replays against that.
+
+import sys
+import time
+import socket
+import random
+import struct
+import asyncio
+import argparse
+import collections
+import multiprocessing
+
+import tinydns_data
+
+HEADER = struct.Struct('>HHHHHH') # id, flags, qdcount, ancount, nscount, arcount
+QUESTION = struct.Struct('>HH') # type, class
+RR_FIXED = struct.Struct('>HHLH') # type, class, TTL, rdlength
+
+CLASS_IN = 1
+CLASS_ANY = 255
+TYPE_OPT = 41
+TYPE_ANY = 255
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_NXDOMAIN = 3
+RCODE_NOTIMP = 4
+RCODE_REFUSED = 5
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+
+# Types whose data is only a name, or (offset) ends in one, which may be
+# compressed; SOA data has two names
+compressed_names = {
+    tinydns_data.RR_TYPE_NS: 0,
+    tinydns_data.RR_TYPE_CNAME: 0,
+    tinydns_data.RR_TYPE_PTR: 0,
+    tinydns_data.RR_TYPE_MX: 2,
+    }
+
+# The biggest UDP answer sent to EDNS clients
+max_udp_size = 1232
+
+def nameLength(data, pos=0):
+    """Length of the uncompressed name at pos in data"""
+    start = pos
+    while data[pos] != 0:
+        pos += data[pos] + 1
+    return pos + 1 - start
+
+def suffixes(name):
+    """Yield name (in DNS format) and each name above it, up to the root"""
+    pos = 0
+    while True:
+        yield name[pos:]
+        if name[pos] == 0:
+            return
+        pos += name[pos] + 1
+
+def clientAddress(host):
+    """The IPv4 address (as bytes) of a client, or None"""
+    try:
+        return socket.inet_aton(host)
+    except OSError:
+        pass
+    if host.startswith('::ffff:'):
+        try:
+            return socket.inet_aton(host[7:])
+        except OSError:
+            pass
+    return None
+
+class RecordIndex:
+    """The records of a database, by owner name (lower case, in DNS format),
+    and the '%' locations, by IPv4 prefix. A sink like CdbWriter, so data can
+    be compiled straight into it.
+    """
+    def __init__(self):
+        # name -> [(type, location, ttl, ttd, rdata), ...]
+        self.names = {}
+        # prefix -> location
+        self.locations = {}
+        self.count = 0
+
+    def add(self, key, value):
+        key = bytes(key)
+        value = bytes(value)
+        self.count += 1
+        if key[:2] == b'\0%':
+            self.locations[key[2:]] = value
+            return
+        type_ = (value[0] << 8) | value[1]
+        if value[2:3] == b'>':
+            loc = value[3:5]
+            ttl, ttd = struct.unpack_from('>LQ', value, 5)
+            rdata = value[tinydns_data.RECORD_HEADER_LOC.size:]
+        else:
+            loc = None
+            ttl, ttd = struct.unpack_from('>LQ', value, 3)
+            rdata = value[tinydns_data.RECORD_HEADER.size:]
+        self.names.setdefault(key.lower(), []).append((type_, loc, ttl, ttd, rdata))
+
+    def finish(self):
+        pass
+
+    def abort(self):
+        pass
+
+    def location(self, address):
+        """The location of a client at address (IPv4 bytes or None): that
+        of the longest '%' prefix it's in
+        """
+        if not self.locations:
+            return None
+        if address is None:
+            return self.locations.get(b'')
+        for length in range(4, -1, -1):
+            loc = self.locations.get(address[:length])
+            if loc is not None:
+                return loc
+        return None
+
+    def records(self, name, loc, now):
+        """Yield (type, ttl, rdata) of the records for name that a client at
+        loc gets at now (a TAI64 time, like TTDs)
+        """
+        for type_, rloc, ttl, ttd, rdata in self.names.get(name, ()):
+            if rloc is not None and rloc != loc:
+                continue
+            ttl = tinydns_data.servedTtl(ttl, ttd, now)
+            if ttl is not None:
+                yield type_, ttl, rdata
+
+def loadIndex(inputs):
+    """Load a RecordIndex from a cdb file or snapshot, or compile it from
+    data files
+    """
+    index = RecordIndex()
+    if len(inputs) == 1 and (inputs[0].endswith('.cdb') or inputs[0].endswith('.snap')):
+        with tinydns_data.openDatabase(inputs[0]) as reader:
+            for key, value in reader:
+                index.add(key, value)
+    else:
+        source = tinydns_data.DataSource(inputs)
+        tinydns_data.Compiler(serial=source.serial()).compile(source, index)
+    return index
+
+class Message:
+    """A DNS message being built, compressing names against those already
+    in it
+    """
+    def __init__(self):
+        self.data = bytearray(HEADER.size)
+        # lower case name -> where it is in the message
+        self.offsets = {}
+
+    def name(self, name):
+        pos = 0
+        while name[pos] != 0:
+            suffix = name[pos:].lower()
+            offset = self.offsets.get(suffix)
+            if offset is not None:
+                self.data += struct.pack('>H', 0xc000 | offset)
+                return
+            if len(self.data) < 0x4000:
+                self.offsets[suffix] = len(self.data)
+            length = name[pos] + 1
+            self.data += name[pos:pos + length]
+            pos += length
+        self.data.append(0)
+
+    def question(self, qname, qtype, qclass):
+        self.name(qname)
+        self.data += QUESTION.pack(qtype, qclass)
+
+    def record(self, owner, type_, ttl, rdata):
+        self.name(owner)
+        start = len(self.data)
+        self.data += RR_FIXED.pack(type_, CLASS_IN, ttl, 0)
+        if type_ == tinydns_data.RR_TYPE_SOA:
+            first = nameLength(rdata)
+            second = nameLength(rdata, first)
+            self.name(rdata[:first])
+            self.name(rdata[first:first + second])
+            self.data += rdata[first + second:]
+        elif type_ in compressed_names:
+            offset = compressed_names[type_]
+            self.data += rdata[:offset]
+            self.name(rdata[offset:])
+        else:
+            self.data += rdata
+        struct.pack_into('>H', self.data, start + 8, len(self.data) - start - RR_FIXED.size)
+
+    def opt(self, size):
+        self.data += b'\0' + RR_FIXED.pack(TYPE_OPT, size, 0, 0)
+
+def parseQuery(query):
+    """Parse a query into (id, flags, qname, qtype, qclass, end of the
+    question, EDNS UDP size or None). Raises ValueError if it's malformed.
+    """
+    if len(query) < HEADER.size:
+        raise ValueError("short query")
+    id_, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(query)
+    if qdcount != 1:
+        raise ValueError("not one question")
+    try:
+        pos = HEADER.size
+        while query[pos] != 0:
+            if query[pos] & 0xc0:
+                raise ValueError("compressed question")
+            pos += query[pos] + 1
+        pos += 1
+        qname = bytes(query[HEADER.size:pos])
+        qtype, qclass = QUESTION.unpack_from(query, pos)
+        end = pos + QUESTION.size
+        edns = None
+        pos = end
+        for i in range(ancount + nscount + arcount):
+            # Only the OPT record (whose owner is the root) matters
+            while query[pos] != 0:
+                if query[pos] & 0xc0:
+                    pos += 1
+                    break
+                pos += query[pos] + 1
+            pos += 1
+            type_, class_, ttl, rdlength = RR_FIXED.unpack_from(query, pos)
+            pos += RR_FIXED.size + rdlength
+            if type_ == TYPE_OPT:
+                edns = max(512, class_)
+    except (IndexError, struct.error):
+        raise ValueError("truncated query") from None
+    return id_, flags, qname, qtype, qclass, end, edns
+
+class Responder:
+    """Answers queries from a RecordIndex. Answers are kept in a cache of
+    cache_size entries (0 for none) for up to cache_ttl seconds, keyed on the
+    question, the client's location and how big the answer may be.
+    """
+    def __init__(self, index, cache_size=10000, cache_ttl=10.0):
+        self.index = index
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache = collections.OrderedDict()
+        self.queries = 0
+        self.hits = 0
+
+    def respond(self, query, host, tcp=False):
+        """Return the response to query from a client at host, or None to
+        drop it
+        """
+        self.queries += 1
+        try:
+            id_, flags, qname, qtype, qclass, end, edns = parseQuery(query)
+        except ValueError:
+            if len(query) < HEADER.size or query[2] & 0x80:
+                return None
+            response = bytearray(query[:HEADER.size])
+            struct.pack_into('>HHHHH', response, 2, FLAG_QR | (query[2] << 8 & 0x7900) | RCODE_FORMERR, 0, 0, 0, 0)
+            return bytes(response)
+        if flags & FLAG_QR:
+            return None
+
+        if tcp:
+            size = 65535
+        elif edns is not None:
+            size = min(edns, max_udp_size)
+        else:
+            size = 512
+        loc = self.index.location(clientAddress(host))
+        key = (qname.lower(), qtype, qclass, flags & 0x7900, loc, size, edns is not None)
+        if self.cache_size:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                self.cache.move_to_end(key)
+                # The cached answer with this query's ID and question (which
+                # may differ in case)
+                return struct.pack('>H', id_) + entry[1][2:HEADER.size] + query[HEADER.size:end] + \
+                        entry[1][end:]
+
+        response = self.answer(id_, flags, qname, qtype, qclass, loc, size, edns)
+        if self.cache_size:
+            self.cache[key] = (time.monotonic() + self.cache_ttl, response)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return response
+
+    def answer(self, id_, flags, qname, qtype, qclass, loc, size, edns):
+        opcode = flags & 0x7800
+        rcode = RCODE_NOERROR
+        answers = authority = additional = ()
+        aa = False
+        if opcode != 0:
+            rcode = RCODE_NOTIMP
+        elif qclass not in (CLASS_IN, CLASS_ANY):
+            rcode = RCODE_REFUSED
+        else:
+            rcode, aa, answers, authority, additional = self.lookup(qname, qtype, loc)
+
+        header_flags = FLAG_QR | opcode | (flags & FLAG_RD) | rcode
+        if aa:
+            header_flags |= FLAG_AA
+        message = Message()
+        message.question(qname, qtype, qclass)
+        question_end = len(message.data)
+        for section in (answers, authority, additional):
+            for owner, type_, ttl, rdata in section:
+                message.record(owner, type_, ttl, rdata)
+        counts = [len(answers), len(authority), len(additional)]
+        if edns is not None:
+            message.opt(max_udp_size)
+            counts[2] += 1
+        if len(message.data) > size:
+            # Too big: send the question alone, telling the client to retry
+            # with TCP
+            del message.data[question_end:]
+            header_flags |= FLAG_TC
+            counts = [0, 0, 0]
+        HEADER.pack_into(message.data, 0, id_, header_flags, 1, *counts)
+        return bytes(message.data)
+
+    def lookup(self, qname, qtype, loc):
+        """Return (rcode, authoritative, answers, authority, additional),
+        each section a list of (owner, type, ttl, rdata)
+        """
+        index = self.index
+        now = tinydns_data.taiNow()
+        name = qname.lower()
+        names = list(suffixes(name))
+        apex = None
+        for i, suffix in enumerate(names):
+            for type_, ttl, rdata in index.records(suffix, loc, now):
+                if type_ == tinydns_data.RR_TYPE_SOA:
+                    apex = i
+                    soa = (suffix, type_, ttl, rdata)
+                    break
+            if apex is not None:
+                break
+        if apex is None:
+            return RCODE_REFUSED, False, [], [], []
+
+        # Delegated away below the apex?
+        for suffix in reversed(names[:apex]):
+            servers = [(suffix, type_, ttl, rdata) for type_, ttl, rdata in index.records(suffix, loc, now)
+                    if type_ == tinydns_data.RR_TYPE_NS]
+            if servers:
+                return RCODE_NOERROR, False, [], servers, self.addresses(servers, loc, now)
+
+        records = list(index.records(name, loc, now))
+        if not records:
+            # Wildcards, from the closest one down
+            for suffix in names[1:apex + 1]:
+                records = list(index.records(b'\1*' + suffix, loc, now))
+                if records:
+                    break
+        if not records:
+            # Like tinydns, a name with no records for this client (even if
+            # it has some for others) doesn't exist
+            return RCODE_NXDOMAIN, True, [], [soa], []
+
+        cnames = [(qname, type_, ttl, rdata) for type_, ttl, rdata in records if type_ == tinydns_data.RR_TYPE_CNAME]
+        if cnames and qtype not in (tinydns_data.RR_TYPE_CNAME, TYPE_ANY):
+            return RCODE_NOERROR, True, cnames, [], []
+        answers = [(qname, type_, ttl, rdata) for type_, ttl, rdata in records if qtype in (type_, TYPE_ANY)]
+        if not answers:
+            return RCODE_NOERROR, True, [], [soa], []
+        return RCODE_NOERROR, True, answers, [], self.addresses(answers, loc, now)
+
+    def addresses(self, records, loc, now):
+        """The A and AAAA records of the servers named by NS and MX records"""
+        additional = []
+        seen = set()
+        for owner, type_, ttl, rdata in records:
+            if type_ not in (tinydns_data.RR_TYPE_NS, tinydns_data.RR_TYPE_MX):
+                continue
+            target = rdata[compressed_names[type_]:].lower()
+            if target in seen:
+                continue
+            seen.add(target)
+            for rtype, rttl, rrdata in self.index.records(target, loc, now):
+                if rtype in (tinydns_data.RR_TYPE_A, tinydns_data.RR_TYPE_AAAA):
+                    additional.append((target, rtype, rttl, rrdata))
+        return additional
+
+class UdpServer(asyncio.DatagramProtocol):
+    def __init__(self, responder):
+        self.responder = responder
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        response = self.responder.respond(data, addr[0])
+        if response is not None:
+            self.transport.sendto(response, addr)
+
+async def serveTcp(responder, reader, writer):
+    host = writer.get_extra_info('peername')[0]
+    try:
+        while True:
+            length = struct.unpack('>H', await reader.readexactly(2))[0]
+            query = await reader.readexactly(length)
+            response = responder.respond(query, host, tcp=True)
+            if response is None:
+                break
+            writer.write(struct.pack('>H', len(response)) + response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+        # Cancelled when shutting down; just close the connection
+        pass
+    finally:
+        writer.close()
+
+async def serve(responder, host, port, ready=None):
+    """Answer queries on UDP and TCP port port of host, forever. ready (if
+    given) is called once the sockets are open.
+    """
+    loop = asyncio.get_event_loop()
+    transport, protocol = await loop.create_datagram_endpoint(lambda: UdpServer(responder), local_addr=(host, port))
+    server = await asyncio.start_server(lambda reader, writer: serveTcp(responder, reader, writer), host, port)
+    if ready is not None:
+        ready()
+    try:
+        # Until cancelled (Server.serve_forever needs Python 3.7)
+        await loop.create_future()
+    finally:
+        server.close()
+        transport.close()
+
+def runLoop(coroutine):
+    """Run coroutine in a new event loop and return its result, cancelling
+    whatever is left when it finishes or is interrupted, like asyncio.run
+    (which needs Python 3.7)
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        tasks = [task for task in all_tasks(loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        asyncio.set_event_loop(None)
+        loop.close()
+
+def makeQuery(id_, qname, qtype):
+    return HEADER.pack(id_, 0, 1, 0, 0, 0) + qname + QUESTION.pack(qtype, CLASS_IN)
+
+def readQueries(path):
+    """(name in DNS format, type) of each query in a file of names, each
+    optionally followed by a type (A if not), like tinydns-get.py --names
+    """
+    queries = []
+    with (sys.stdin if path == '-' else open(path)) as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0][0] == '#':
+                continue
+            type_ = tinydns_data.rrTypeNumber(parts[1]) if len(parts) > 1 else tinydns_data.RR_TYPE_A
+            queries.append((tinydns_data.name_to_dns(parts[0]), type_))
+    return queries
+
+def indexQueries(index, seed=1):
+    """A query for every name and type in index, in a random order"""
+    queries = set()
+    for name, records in index.names.items():
+        for type_, loc, ttl, ttd, rdata in records:
+            queries.add((name, type_))
+    queries = sorted(queries)
+    random.Random(seed).shuffle(queries)
+    return queries
+
+class ReplayClient(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.waiting = {}
+
+    def datagram_received(self, data, addr):
+        if len(data) < HEADER.size:
+            return
+        future = self.waiting.pop(struct.unpack_from('>H', data)[0], None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+async def replay(server, queries, count, concurrency=100, timeout=2.0):
+    """Send count queries (cycling through queries) to server, concurrency
+    at a time. Returns the statistics as a dict.
+    """
+    loop = asyncio.get_event_loop()
+    transport, client = await loop.create_datagram_endpoint(ReplayClient, remote_addr=server)
+    latencies = []
+    rcodes = collections.Counter()
+    timeouts = 0
+    sent = 0
+    ids = iter(range(1 << 62))
+
+    async def worker():
+        nonlocal sent, timeouts
+        while sent < count:
+            qname, qtype = queries[sent % len(queries)]
+            sent += 1
+            id_ = next(ids) & 0xffff
+            while id_ in client.waiting:
+                id_ = next(ids) & 0xffff
+            future = loop.create_future()
+            client.waiting[id_] = future
+            start = time.perf_counter()
+            transport.sendto(makeQuery(id_, qname, qtype))
+            try:
+                response = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                client.waiting.pop(id_, None)
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            rcodes[response[3] & 0xf] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for i in range(min(concurrency, count))])
+    seconds = time.perf_counter() - start
+    transport.close()
+    latencies.sort()
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return {
+        'queries': count,
+        'answered': len(latencies),
+        'timeouts': timeouts,
+        'seconds': seconds,
+        'qps': len(latencies) / seconds if seconds else 0,
+        'latency_ms': {'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99),
+            'max': latencies[-1] * 1000 if latencies else None},
+        'rcodes': dict(rcodes),
+        }
+
+def runServer(index, host, port, cache_size, cache_ttl, ready=None):
+    responder = Responder(index, cache_size, cache_ttl)
+    try:
+        runLoop(serve(responder, host, port, ready))
+    except KeyboardInterrupt:
+        pass
+
+def freePort(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer DNS queries from tinydns data, or replay queries to measure a server")
+    parser.add_argument('inputs', nargs='*', default=['data.cdb'], metavar='INPUT',
+            help="cdb file, snapshot ('.snap') or data files to answer from (default: data.cdb)")
+    parser.add_argument('-l', '--listen', default='127.0.0.1',
+            help="address to answer on (default: %(default)s)")
+    parser.add_argument('-p', '--port', type=int, default=5353,
+            help="port to answer on (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=10000,
+            help="number of answers to cache, 0 for none (default: %(default)s)")
+    parser.add_argument('--cache-ttl', type=float, default=10.0, metavar='SECONDS',
+            help="how long to reuse a cached answer (default: %(default)s)")
+    parser.add_argument('--replay', action='store_true',
+            help="send queries and report how fast they're answered, instead of answering")
+    parser.add_argument('--server', metavar='HOST:PORT',
+            help="with --replay, the server to query (default: start one for the inputs)")
+    parser.add_argument('--queries', metavar='FILE',
+            help="with --replay, file of names to query ('-' for stdin), each optionally followed by a type "
+                "(default: every name and type in the inputs)")
+    parser.add_argument('-n', '--count', type=int, default=100000,
+            help="with --replay, number of queries to send (default: %(default)s)")
+    parser.add_argument('-c', '--concurrency', type=int, default=100,
+            help="with --replay, number of queries to keep outstanding (default: %(default)s)")
+    parser.add_argument('--timeout', type=float, default=2.0, metavar='SECONDS',
+            help="with --replay, how long to wait for each answer (default: %(default)s)")
+    parser.add_argument('--json', action='store_true',
+            help="with --replay, print the results as JSON")
+    args = parser.parse_args()
+
+    if not args.replay:
+        start = time.monotonic()
+        index = loadIndex(args.inputs)
+        print("Loaded {} records in {:.3f}s; answering on {} port {}".format(
+            index.count, time.monotonic() - start, args.listen, args.port), file=sys.stderr, flush=True)
+        responder = Responder(index, args.cache_size, args.cache_ttl)
+        try:
+            runLoop(serve(responder, args.listen, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    index = None
+    if not args.server or not args.queries:
+        index = loadIndex(args.inputs)
+    if args.queries:
+        queries = readQueries(args.queries)
+    else:
+        queries = indexQueries(index)
+    if not queries:
+        parser.error("no queries to send")
+    process = None
+    if args.server:
+        host, sep, port = args.server.rpartition(':')
+        if not sep:
+            parser.error("--server must be HOST:PORT")
+        server = (host, int(port))
+    else:
+        server = (args.listen, freePort(args.listen))
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(target=runServer, args=(index, server[0], server[1],
+                args.cache_size, args.cache_ttl, ready.set), daemon=True)
+        process.start()
+        if not ready.wait(600):
+            parser.error("the responder didn't start")
+    try:
+        results = runLoop(replay(server, queries, args.count, args.concurrency, args.timeout))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    if args.json:
+        import json
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+    else:
+        latency = results['latency_ms']
+        print("{answered} of {queries} queries answered in {seconds:.3f}s: {qps:.0f} queries/s".format(**results))
+        if results['answered']:
+            print("latency: p50 {p50:.3f}ms, p90 {p90:.3f}ms, p99 {p99:.3f}ms, max {max:.3f}ms".format(**latency))
+        print("rcodes: " + ', '.join("{}: {}".format(rcode, n) for rcode, n in sorted(results['rcodes'].items())))
+        if results['timeouts']:
+            print("{} timeouts".format(results['timeouts']))
+    return 1 if results['timeouts'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3679 @@
+# Converts tinydns 'data' lines into the records of a tinydns cdb database.
+#
+# The Compiler class (or the compile function) does the conversion, handing
+# each record to a writer: CdbWriter writes a cdb file directly, and
+# CdbTextWriter makes output in the style of cdb-dump, for piping to cdbmake
+# or cdb. main() is the tinydns-data.py command line.
+
+import sys
+import time
+import os
+import codecs
+import struct
+import array
+import mmap
+import ipaddress
+import argparse
+import re
+import select
+import bisect
+import hashlib
+import heapq
+import shutil
+import tempfile
+import pickle
+import json
+import sqlite3
+import collections
+import concurrent.futures
+import functools
+import itertools
+import importlib
+import importlib.util
+
+default_TTL = "86400"
+
+RR_TYPE_A = 1
+RR_TYPE_NS = 2
+RR_TYPE_CNAME = 5
+RR_TYPE_SOA = 6
+RR_TYPE_PTR = 12
+RR_TYPE_MX = 15
+RR_TYPE_TXT = 16
+RR_TYPE_AAAA = 28
+RR_TYPE_SRV = 33
+RR_TYPE_NAPTR = 35
+RR_TYPE_CERT = 37
+RR_TYPE_DS = 43
+RR_TYPE_SSHFP = 44
+RR_TYPE_TLSA = 52
+RR_TYPE_OPENPGPKEY = 61
+RR_TYPE_SVCB = 64
+RR_TYPE_HTTPS = 65
+RR_TYPE_AXFR = 252
+RR_TYPE_CAA = 257
+
+# Pre-compiled layouts for the fixed size parts of records
+U8 = struct.Struct('>B')
+U16 = struct.Struct('>H')
+U32 = struct.Struct('>L')
+U64 = struct.Struct('>Q')
+RECORD_HEADER = struct.Struct('>HcLQ') # type, '=', TTL, TTD
+RECORD_HEADER_LOC = struct.Struct('>Hc2sLQ') # type, '>', location, TTL, TTD
+MX_NUMBERS = U16 # preference
+SRV_NUMBERS = struct.Struct('>HHH') # priority, weight, port
+SOA_NUMBERS = struct.Struct('>LLLLL') # serial, refresh, retry, expire, minimum
+
+def pack(layout, *values):
+    """Pack values with one of the layouts above, with a readable error if a
+    value doesn't fit (or isn't a number)
+    """
+    try:
+        return layout.pack(*values)
+    except struct.error as e:
+        raise Exception("Can't pack {} as '{}': {}".format(values, layout.format, e)) from None
+
+def ipv4_to_bytes(ipv4):
+    parts = ipv4.split('.')
+    if len(parts) != 4:
+        raise Exception("invalid IPv4 address")
+    try:
+        return bytes(map(int, parts))
+    except ValueError:
+        raise Exception("invalid IPv4 address {}".format(ipv4)) from None
+
+def ipv4_to_u32(ipv4):
+    return int.from_bytes(ipv4_to_bytes(ipv4), 'big')
+
+def ipv6_to_bytes(ipv6):
+    data = codecs.decode(ipv6, 'hex')
+    if len(data) != 16:
+        raise Exception("hex isn't 16 bytes IPv6 address")
+    return data
+
+def u_to_bytes(u, bits):
+    if bits & 0x7:
+        raise Exception("Extra bits; not byte aligned")
+    if u >= 2**bits:
+        raise Exception("Given number {} doesn't fit in {} bits".format(u, bits))
+    return u.to_bytes(bits >> 3, 'big')
+
+def u8_to_bytes(u8):
+    return pack(U8, u8)
+
+def u16_to_bytes(u16):
+    return pack(U16, u16)
+
+def u32_to_bytes(u32):
+    return pack(U32, u32)
+
+def u64_to_bytes(u64):
+    return pack(U64, u64)
+
+def name_to_labels(name):
+    if name.endswith('.'):
+        name = name[:-1]
+    parts = name.split('.')
+    return parts
+
+def labels_to_dns(labels):
+    # TODO: Handle unicde to punicode or whatever
+    res = []
+    if len(labels[-1]) == 0:
+        # Allow optional trailing NULL label (e.g. a name ending in a '.' from
+        # name_to_labels()), we'll add the trailing NULL back at the end.
+        # Actually, name_to_labels already strips that, but other things might
+        # not. Also, this fixes the special case of just the root label.
+        labels = labels[:-1]
+    for part in labels:
+        if isinstance(part, str):
+            p = part.encode('ascii')
+        else:
+            p = part
+        l = len(part)
+        if l == 0 or l > 255:
+            raise Exception("bad label length {}".format(l))
+        res.append(bytes([l]) + p)
+    res.append(bytes([0])) # NULL aka root label
+    return b''.join(res)
+
+def label_to_dns(label):
+    l = len(label)
+    if l == 0 or l > 255:
+        raise Exception("bad label length {}".format(l))
+    return bytes([l]) + label.encode('ascii')
+
+def _suffix_to_dns(name):
+    # Encodes the first label and looks up the rest of the name in the
+    # cache, so names sharing a suffix (e.g. a zone apex) share its encoding.
+    label, dot, rest = name.partition('.')
+    if not dot:
+        if label == '':
+            # Only the root label left
+            return bytes([0])
+        return label_to_dns(label) + bytes([0])
+    return label_to_dns(label) + suffix_to_dns(rest)
+
+def _name_to_dns(name):
+    if name.endswith('.'):
+        name = name[:-1]
+    return suffix_to_dns(name)
+
+name_cache_size = 65536
+suffix_to_dns = functools.lru_cache(maxsize=name_cache_size)(_suffix_to_dns)
+name_to_dns = functools.lru_cache(maxsize=name_cache_size)(_name_to_dns)
+
+def setNameCacheSize(size):
+    """Change how many names (and name suffixes) are kept in the encoded
+    name cache. This also empties the cache.
+    """
+    global name_cache_size, suffix_to_dns, name_to_dns
+    name_cache_size = size
+    suffix_to_dns = functools.lru_cache(maxsize=size)(_suffix_to_dns)
+    name_to_dns = functools.lru_cache(maxsize=size)(_name_to_dns)
+
+# The name cache hits and misses, and suffix cache hits and misses, of the
+# worker processes (see processChunk)
+worker_name_cache_counts = [0, 0, 0, 0]
+
+def nameCacheCounts():
+    """The name cache hits and misses, and suffix cache hits and misses, of
+    this process
+    """
+    names = name_to_dns.cache_info()
+    suffixes = suffix_to_dns.cache_info()
+    return (names.hits, names.misses, suffixes.hits, suffixes.misses)
+
+def nameCacheStats():
+    """Return a description of how well the encoded name cache worked, in
+    this process and any worker processes
+    """
+    counts = [ours + theirs for ours, theirs in zip(nameCacheCounts(), worker_name_cache_counts)]
+    return "name cache: {} hits, {} misses; suffix cache: {} hits, {} misses (size {})".format(
+            *counts, name_cache_size)
+
+# A backslash followed by 1 to 3 octal digits, any other character, or the
+# end of the text
+ESCAPE = re.compile(rb'\\([0-7]{1,3}|.|$)', re.DOTALL)
+# The byte for each octal escape, in 1, 2 and 3 digit forms
+ESCAPE_OCTAL = {}
+for i in range(256):
+    for fmt in ('{:o}', '{:02o}', '{:03o}'):
+        ESCAPE_OCTAL[fmt.format(i).encode('ascii')] = bytes([i])
+del i, fmt
+
+def _deescape_match(match):
+    seq = match.group(1)
+    res = ESCAPE_OCTAL.get(seq)
+    if res is not None:
+        return res
+    if seq == b'':
+        raise Exception("Text ends with an incomplete '\\' escape")
+    if seq[0] in b'01234567':
+        raise Exception("Octal escape '\\{}' is out of range (over \\377)".format(seq.decode('ascii')))
+    # Any other escaped character stands for itself (e.g. '\\' or '\:')
+    return seq
+
+def deescape_text(text):
+    """Given text with escaped octal data, convert the octal data to equivalent bytes.
+    For example:
+        "v=spf1 ip4\\072198.51.100.33/29" -> "v=spf1 ip4:198.51.100.33/29"
+    Like tinydns-data, the escape can be 1 to 3 octal digits, and a backslash
+    followed by anything else stands for that character.
+    Assumes the text is ASCII
+    """
+    # Note: The \\ shown above is a single '\', it's escaped here so it shows
+    # correctly in printed docstrings.
+    # TODO: Support utf8? I haven't found anything indicating that text
+    # records must be 7-bit safe, or ascii instead of binary.
+    text = text.encode('ascii')
+    if b'\\' not in text:
+        return text
+    return ESCAPE.sub(_deescape_match, text)
+
+def text_to_strings(text, size=127):
+    """Split text into character-strings (each prefixed by its length) of at
+    most size bytes, as in TXT records.
+    """
+    if len(text) == 0:
+        return b'\0'
+    return b''.join([bytes([len(chunk)]) + chunk for chunk in
+        (text[i:i + size] for i in range(0, len(text), size))])
+
+def overlay(given, defaults):
+    """Pull elements from given until we run out, then use defaults
+    also, use defaults if an element in given is empty (that is, None or '')
+    """
+    res = [d if g is None or g == '' else g for g, d in zip(given, defaults)]
+    if len(given) < len(defaults):
+        res.extend(defaults[len(given):])
+    return res
+
+def make_value(type_, loc, ttl, ttd, data):
+    if loc is None:
+        return pack(RECORD_HEADER, type_, b'=', ttl, ttd) + data
+    loc = loc.encode('ascii')
+    if len(loc) != 2:
+        raise Exception("Bad loc")
+    return pack(RECORD_HEADER_LOC, type_, b'>', loc, ttl, ttd) + data
+
+def make_record(name, type_, loc, ttl, ttd, data):
+    return name_to_dns(name), make_value(type_, loc, ttl, ttd, data)
+class CdbTextWriter:
+    """Writes records in the cdbmake text format ("+klen,vlen:key->value"),
+    suitable for piping into cdbmake or 'cdb -c'.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def add(self, key, value):
+        self.stream.write("+{},{}:".format(len(key), len(value)).encode('ascii') + key + b'->' + value + b'\n')
+
+    def finish(self):
+        # The cdbmake format ends with an extra newline after the last record
+        self.stream.write(b'\n')
+        self.stream.flush()
+
+    def abort(self):
+        self.stream.flush()
+
+def cdb_hash(key):
+    h = 5381
+    for c in key:
+        h = ((h << 5) + h) & 0xffffffff ^ c
+    return h
+
+class CdbWriter:
+    """Writes a cdb file directly, without the help of cdbmake.
+
+    The records are written to a temporary file next to the destination,
+    which is renamed into place by finish(), so readers of the destination
+    only ever see a complete database.
+    """
+    def __init__(self, path, tmppath=None):
+        self.path = path
+        if tmppath is None:
+            tmppath = path + '.tmp'
+        self.tmppath = tmppath
+        self.file = open(tmppath, 'wb', buffering=1 << 20)
+        # Room for the header, which is filled in once the tables are known
+        self.file.write(b'\0' * 2048)
+        self.pos = 2048
+        # For each of the 256 tables, the hashes and positions of its records
+        self.hashes = [array.array('I') for i in range(256)]
+        self.positions = [array.array('I') for i in range(256)]
+
+    def add(self, key, value):
+        h = cdb_hash(key)
+        self.hashes[h & 0xff].append(h)
+        self.positions[h & 0xff].append(self.pos)
+        self.file.write(struct.pack('<LL', len(key), len(value)))
+        self.file.write(key)
+        self.file.write(value)
+        self.pos += 8 + len(key) + len(value)
+        if self.pos > 0xffffffff:
+            raise Exception("cdb file too large (over 4GiB)")
+
+    def addPacked(self, h, record):
+        """Like add(), for a record already packed as it is in the file
+        (lengths, key and value), given with the cdb_hash of its key, for
+        adding the same record to many databases
+        """
+        self.hashes[h & 0xff].append(h)
+        self.positions[h & 0xff].append(self.pos)
+        self.file.write(record)
+        self.pos += len(record)
+        if self.pos > 0xffffffff:
+            raise Exception("cdb file too large (over 4GiB)")
+
+    def finish(self):
+        header = []
+        for i in range(256):
+            hashes = self.hashes[i]
+            positions = self.positions[i]
+            slots = len(hashes) * 2
+            table = array.array('I', bytes(8 * slots))
+            for h, pos in zip(hashes, positions):
+                slot = (h >> 8) % slots
+                while table[slot * 2 + 1] != 0:
+                    slot += 1
+                    if slot == slots:
+                        slot = 0
+                table[slot * 2] = h
+                table[slot * 2 + 1] = pos
+            if sys.byteorder != 'little':
+                table.byteswap()
+            header.append(struct.pack('<LL', self.pos, slots))
+            self.file.write(table.tobytes())
+            self.pos += 8 * slots
+            if self.pos > 0xffffffff:
+                raise Exception("cdb file too large (over 4GiB)")
+        self.file.seek(0)
+        self.file.write(b''.join(header))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.rename(self.tmppath, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.tmppath)
+
+class CdbReader:
+    """Reads a cdb file (e.g. one made by CdbWriter) through mmap.
+
+    Values (and keys, when iterating) are returned as memoryviews into the
+    mapping rather than copies, so they're only valid until close().
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if len(self.view) < 2048:
+            self.close()
+            raise Exception("{} is too short to be a cdb file".format(path))
+        self.tables = [struct.unpack_from('<LL', self.view, i * 8) for i in range(256)]
+        # The records end where the first hash table starts
+        self.end = min(pos for pos, slots in self.tables)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # Some returned values are still around; the mapping is closed
+            # once they're gone
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, key):
+        """Yield the value of each record with the given key, in the order
+        they were added.
+        """
+        h = cdb_hash(key)
+        pos, slots = self.tables[h & 0xff]
+        if slots == 0:
+            return
+        view = self.view
+        klen = len(key)
+        slot = (h >> 8) % slots
+        for i in range(slots):
+            rh, rpos = struct.unpack_from('<LL', view, pos + slot * 8)
+            if rpos == 0:
+                return
+            if rh == h:
+                rklen, rvlen = struct.unpack_from('<LL', view, rpos)
+                if rklen == klen and view[rpos + 8:rpos + 8 + klen] == key:
+                    yield view[rpos + 8 + klen:rpos + 8 + klen + rvlen]
+            slot += 1
+            if slot == slots:
+                slot = 0
+
+    def __iter__(self):
+        """Yield every (key, value) record in the order they were added"""
+        view = self.view
+        pos = 2048
+        while pos < self.end:
+            klen, vlen = struct.unpack_from('<LL', view, pos)
+            pos += 8
+            yield view[pos:pos + klen], view[pos + klen:pos + klen + vlen]
+            pos += klen + vlen
+
+SNAPSHOT_MAGIC = b'TDNSSNP1'
+# magic, metadata size, names, records, names size, values size
+SNAPSHOT_HEADER = struct.Struct('<8sLLLQQ')
+
+class SnapshotWriter:
+    """Writes the records (given to add(), like CdbWriter) to a snapshot: a
+    file from which SnapshotReader can get them back without compiling the
+    data again, e.g. to write them out for other locations or shards, or to
+    query, diff or lint them.
+
+    Along with the records, a snapshot keeps the line each came from and
+    its type (its first character), taken from compiler (see
+    Compiler.lineno), and the files the lines came from, from source (a
+    DataSource), so lines can still be located.
+
+    The file is little endian: the header, JSON metadata (the serial and
+    where the lines came from), then arrays of 32 bit numbers: for each
+    name, where it starts in the names; for each record, its name, line and
+    where its value starts in the values; the records of each name, in name
+    order, and where those of each name start; then a byte per record for
+    its type; the names (each only once, in order); and the values.
+    """
+    def __init__(self, path, compiler=None, source=None):
+        self.path = path
+        self.compiler = compiler
+        self.source = source
+        self.names = {}
+        self.record_names = array.array('I')
+        self.record_lines = array.array('I')
+        self.record_types = bytearray()
+        self.values = bytearray()
+        self.value_offsets = array.array('I', [0])
+
+    def add(self, key, value):
+        key = bytes(key)
+        name = self.names.get(key)
+        if name is None:
+            name = self.names[key] = len(self.names)
+        self.record_names.append(name)
+        if self.compiler is not None:
+            self.record_lines.append(self.compiler.lineno)
+            self.record_types.append(ord(self.compiler.linetype or ' ') & 0xff)
+        else:
+            self.record_lines.append(0)
+            self.record_types.append(0x20)
+        self.values += value
+        if len(self.values) > 0xffffffff:
+            raise Exception("snapshot too large (values over 4GiB)")
+        self.value_offsets.append(len(self.values))
+
+    def metadata(self):
+        metadata = {}
+        if self.compiler is not None:
+            metadata['serial'] = self.compiler.serial
+        if self.source is not None:
+            metadata['segments'] = self.source.segments
+        return json.dumps(metadata).encode('utf-8')
+
+    def finish(self):
+        # Names are stored sorted, so get() can find them by bisection
+        names = sorted(self.names)
+        order = array.array('I', bytes(4 * len(names)))
+        for i, name in enumerate(names):
+            order[self.names[name]] = i
+        record_names = array.array('I', (order[name] for name in self.record_names))
+        name_offsets = array.array('I', [0])
+        size = 0
+        for name in names:
+            size += len(name)
+            name_offsets.append(size)
+        # The records of each name, in name order: counting sort by name
+        name_starts = array.array('I', bytes(4 * (len(names) + 1)))
+        for name in record_names:
+            name_starts[name + 1] += 1
+        for i in range(len(names)):
+            name_starts[i + 1] += name_starts[i]
+        name_records = array.array('I', bytes(4 * len(record_names)))
+        filled = array.array('I', name_starts)
+        for record, name in enumerate(record_names):
+            name_records[filled[name]] = record
+            filled[name] += 1
+
+        metadata = self.metadata()
+        tmppath = self.path + '.tmp'
+        with open(tmppath, 'wb', buffering=1 << 20) as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(metadata), len(names),
+                    len(record_names), size, len(self.values)))
+            f.write(metadata)
+            for table in (name_offsets, record_names, self.record_lines, self.value_offsets,
+                    name_records, name_starts):
+                if sys.byteorder != 'little':
+                    table = array.array('I', table)
+                    table.byteswap()
+                f.write(table.tobytes())
+            f.write(self.record_types)
+            for name in names:
+                f.write(name)
+            f.write(self.values)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmppath, self.path)
+
+    def abort(self):
+        pass
+
+class SnapshotReader:
+    """Reads a snapshot written by SnapshotWriter through mmap, with the
+    same interface as CdbReader: get(key), iterating over the (key, value)
+    records, close() and use as a context manager. records() also gives the
+    line and type of each record, and locate() turns a line number into the
+    file and line it came from.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, metadata_size, self.name_count, self.record_count, names_size, values_size = \
+                    SNAPSHOT_HEADER.unpack_from(self.map)
+        except struct.error:
+            magic = None
+        if magic != SNAPSHOT_MAGIC:
+            self.map.close()
+            raise Exception("{} isn't a snapshot".format(path))
+        pos = SNAPSHOT_HEADER.size
+        self.metadata = json.loads(self.map[pos:pos + metadata_size].decode('utf-8'))
+        pos += metadata_size
+        view = memoryview(self.map)
+        self.views = [view]
+        def table(count):
+            nonlocal pos
+            data = view[pos:pos + 4 * count]
+            pos += 4 * count
+            if sys.byteorder != 'little':
+                swapped = array.array('I', data)
+                swapped.byteswap()
+                return swapped
+            data = data.cast('I')
+            self.views.append(data)
+            return data
+        self.name_offsets = table(self.name_count + 1)
+        self.record_names = table(self.record_count)
+        self.record_lines = table(self.record_count)
+        self.value_offsets = table(self.record_count + 1)
+        self.name_records = table(self.record_count)
+        self.name_starts = table(self.name_count + 1)
+        self.record_types = view[pos:pos + self.record_count]
+        self.views.append(self.record_types)
+        pos += self.record_count
+        self.names_start = pos
+        self.values_start = pos + names_size
+        if self.values_start + values_size != len(self.map):
+            self.close()
+            raise Exception("{} is truncated or corrupt".format(path))
+        self.segments = [tuple(segment) for segment in self.metadata.get('segments', [])]
+        self.starts = [segment[0] for segment in self.segments]
+        self.name_cache = {}
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.record_count
+
+    def serial(self):
+        return self.metadata.get('serial')
+
+    def name(self, i):
+        """Name number i (in DNS format), in sorted order"""
+        name = self.name_cache.get(i)
+        if name is None:
+            start = self.names_start
+            name = self.name_cache[i] = self.map[start + self.name_offsets[i]:start + self.name_offsets[i + 1]]
+        return name
+
+    def value(self, record):
+        start = self.values_start
+        return self.map[start + self.value_offsets[record]:start + self.value_offsets[record + 1]]
+
+    def get(self, key):
+        """Yield the value of each record with the given key, in the order
+        they were added
+        """
+        names = self.names_start
+        offsets = self.name_offsets
+        key = bytes(key)
+        low, high = 0, self.name_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.map[names + offsets[middle]:names + offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.name_count or self.name(low) != key:
+            return
+        for i in range(self.name_starts[low], self.name_starts[low + 1]):
+            yield self.value(self.name_records[i])
+
+    def __iter__(self):
+        """Yield every (key, value) record in the order they were added"""
+        data = self.map
+        start = self.values_start
+        offsets = self.value_offsets
+        names = self.record_names
+        name = self.name
+        for record in range(self.record_count):
+            yield name(names[record]), data[start + offsets[record]:start + offsets[record + 1]]
+
+    def records(self):
+        """Yield (line, type of line, key, value) for every record in the
+        order they were added
+        """
+        data = self.map
+        start = self.values_start
+        offsets = self.value_offsets
+        names = self.record_names
+        lines = self.record_lines
+        types = self.record_types
+        name = self.name
+        for record in range(self.record_count):
+            yield (lines[record], chr(types[record]), name(names[record]),
+                    data[start + offsets[record]:start + offsets[record + 1]])
+
+    def locate(self, lineno):
+        """Return (path, line in that file) of line lineno, like
+        DataSource.locate
+        """
+        i = bisect.bisect_right(self.starts, lineno) - 1
+        if i < 0:
+            return ("input", lineno)
+        start, path, fileline = self.segments[i]
+        return (path, fileline + lineno - start)
+
+class TeeSink:
+    """A sink giving each record to several others"""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+        self.counts = {}
+
+    def add(self, key, value):
+        for sink in self.sinks:
+            sink.add(key, value)
+
+    def finish(self):
+        for sink in self.sinks:
+            sink.finish()
+        # The outputs written by the first sink, if it keeps count
+        self.counts = getattr(self.sinks[0], 'counts', {})
+
+    def abort(self):
+        for sink in self.sinks:
+            sink.abort()
+
+RUN_RECORD = struct.Struct('<LLQ') # key length, value length, sequence number
+# Roughly what a record costs in memory besides its key and value
+RUN_OVERHEAD = 150
+
+def runRecords(f):
+    """Yield the (key, sequence number, value) records of a run file written
+    by DedupSink. The file is read rather than mapped, as merging maps all
+    of the runs in turn, which would count against the memory of the process.
+    """
+    f.flush()
+    f.seek(0)
+    with open(f.fileno(), 'rb', buffering=1 << 16, closefd=False) as run:
+        while True:
+            header = run.read(RUN_RECORD.size)
+            if not header:
+                return
+            klen, vlen, seq = RUN_RECORD.unpack(header)
+            yield run.read(klen), seq, run.read(vlen)
+
+class DedupSink:
+    """A sink dropping duplicate records (the same key and value, as from
+    repeated lines, or glue given by several '&' or '@' lines) before
+    passing the rest on to out, sorted by key.
+
+    The records of each key keep the order they were added in, which is all
+    tinydns (or any cdb reader) sees of the order, so round robin and the
+    like are unaffected. The sort is external: the records are held in
+    memory until they take up about memory bytes, then sorted and written
+    to a temporary file in directory, and finish() merges these runs.
+    duplicates is the number of records dropped.
+    """
+    def __init__(self, out, memory=64 << 20, directory=None):
+        self.out = out
+        self.memory = memory
+        self.directory = directory
+        self.run = []
+        self.size = 0
+        self.seq = 0
+        self.runs = []
+        self.duplicates = 0
+        self.counts = {}
+
+    def add(self, key, value):
+        key = bytes(key)
+        value = bytes(value)
+        self.run.append((key, self.seq, value))
+        self.seq += 1
+        self.size += len(key) + len(value) + RUN_OVERHEAD
+        if self.size >= self.memory:
+            self.spill()
+
+    def unique(self, records):
+        """Yield the (key, sequence number, value) records, sorted by key
+        and sequence number, that aren't repeats of one before them
+        """
+        previous = None
+        seen = set()
+        for key, seq, value in records:
+            if key != previous:
+                previous = key
+                seen = set()
+            if value in seen:
+                self.duplicates += 1
+                continue
+            seen.add(value)
+            yield key, seq, value
+
+    def spill(self):
+        self.run.sort()
+        f = tempfile.TemporaryFile(dir=self.directory, buffering=1 << 20)
+        self.runs.append(f)
+        for key, seq, value in self.unique(self.run):
+            f.write(RUN_RECORD.pack(len(key), len(value), seq))
+            f.write(key)
+            f.write(value)
+        self.run = []
+        self.size = 0
+
+    def close(self):
+        for f in self.runs:
+            f.close()
+        self.runs = []
+        self.run = []
+
+    def finish(self):
+        try:
+            if self.runs:
+                if self.run:
+                    self.spill()
+                records = heapq.merge(*[runRecords(f) for f in self.runs])
+            else:
+                self.run.sort()
+                records = self.run
+            for key, seq, value in self.unique(records):
+                self.out.add(key, value)
+        except BaseException:
+            self.close()
+            self.out.abort()
+            raise
+        self.close()
+        self.out.finish()
+        self.counts = getattr(self.out, 'counts', {})
+
+    def abort(self):
+        self.close()
+        self.out.abort()
+
+def snapshotPath(path):
+    """The path of the snapshot kept next to an output, e.g. data.snap for
+    data.cdb
+    """
+    return os.path.splitext(path)[0] + '.snap'
+
+def openDatabase(path):
+    """Open a cdb file or, for a name ending in '.snap', a snapshot"""
+    if path.endswith('.snap'):
+        return SnapshotReader(path)
+    return CdbReader(path)
+
+def recordLocation(key, value):
+    """The location a record is for: the location of its loc field, or the
+    one a '%' record assigns, or None for records served to everyone.
+    """
+    if key[:2] == b'\0%':
+        return value.decode('latin-1')
+    if value[2:3] == b'>':
+        return value[3:5].decode('latin-1')
+    return None
+
+def locationPath(path, location):
+    """The path of the output for a location, e.g. data.ab.cdb for data.cdb"""
+    if '/' in location or '\0' in location:
+        raise Exception("Location {!r} can't be used in a file name".format(location))
+    root, ext = os.path.splitext(path)
+    return "{}.{}{}".format(root, location, ext)
+
+def spooledRecords(path):
+    """Yield the (key, value) records of a spool file written by a
+    SpooledSink
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as spool:
+            pos = 0
+            end = len(spool)
+            while pos < end:
+                klen, vlen = struct.unpack_from('<LL', spool, pos)
+                pos += 8
+                yield spool[pos:pos + klen], spool[pos + klen:pos + klen + vlen]
+                pos += klen + vlen
+
+def spoolRecord(f, key, value):
+    f.write(struct.pack('<LL', len(key), len(value)))
+    f.write(key)
+    f.write(value)
+
+def inLocation(location, key, value):
+    loc = recordLocation(key, value)
+    return loc is None or loc == location
+
+class OutputFile:
+    """A database at path, or with text a cdbmake text file, which (like a
+    CdbWriter) is written to a temporary file renamed into place by finish()
+    """
+    def __init__(self, path, text=False):
+        self.path = path
+        self.text = text
+        if text:
+            self.tmppath = path + '.tmp'
+            self.out = CdbTextWriter(open(self.tmppath, 'wb', buffering=1 << 20))
+        else:
+            self.out = CdbWriter(path)
+        self.add = self.out.add
+
+    def finish(self):
+        self.out.finish()
+        if self.text:
+            self.out.stream.close()
+            os.rename(self.tmppath, self.path)
+
+    def abort(self):
+        self.out.abort()
+        if self.text:
+            self.out.stream.close()
+            os.unlink(self.tmppath)
+
+def writeSpooled(spool, path, keep=None, text=False):
+    """Write the records of the spool (those for which keep(key, value) is
+    true, if given) to a database at path, or a cdbmake text file with text.
+    Returns the number of records written.
+    """
+    out = OutputFile(path, text)
+    count = 0
+    try:
+        for key, value in spooledRecords(spool):
+            if keep is None or keep(key, value):
+                out.add(key, value)
+                count += 1
+    except BaseException:
+        out.abort()
+        raise
+    out.finish()
+    return count
+
+def runJobs(jobs, function, *iterables):
+    """map(function, *iterables) as a list, in a pool of jobs processes if
+    jobs > 1
+    """
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            return list(pool.map(function, *iterables))
+    return list(map(function, *iterables))
+
+class SpooledSink:
+    """Base of the sinks (given records by add(), like CdbWriter) that need
+    all the records before they can write anything. The records are spooled
+    to a file next to path in the cdb record format, and finish() writes the
+    outputs from it (see spooledRecords), in a pool of jobs processes.
+
+    note(key, value) is called with each record as it's added.
+    """
+    def __init__(self, path, text=False, jobs=1):
+        self.path = path
+        self.text = text
+        self.jobs = jobs
+        self.spool = path + '.spool'
+        self.file = open(self.spool, 'wb', buffering=1 << 20)
+        # The number of records written to each output, by finish()
+        self.counts = {}
+
+    def add(self, key, value):
+        self.note(key, value)
+        spoolRecord(self.file, key, value)
+
+    def note(self, key, value):
+        pass
+
+    def abort(self):
+        self.file.close()
+        os.unlink(self.spool)
+
+class LocationSplitter(SpooledSink):
+    """Splits the records into one output per '%' location, so each server
+    only has to load the records it can serve.
+
+    The output for a location, e.g. data.ab.cdb for location 'ab' and the
+    path data.cdb, has the records for that location (along with its '%'
+    records, so its clients are still told apart from others) and the
+    records served to everyone. path itself gets only the records served to
+    everyone. Records for a location no '%' line assigns are dropped, as no
+    client could ever get them. With text, the outputs are in the cdbmake
+    text format.
+
+    All the outputs are written at once, in a single pass over the spool
+    (so jobs isn't used).
+    """
+    def __init__(self, path, text=False, jobs=1):
+        super().__init__(path, text, jobs)
+        self.locations = set()
+        self.used = collections.Counter()
+
+    def note(self, key, value):
+        location = recordLocation(key, value)
+        if key[:2] == b'\0%':
+            self.locations.add(location)
+        elif location is not None:
+            self.used[location] += 1
+
+    def outputs(self):
+        """(path, location) of each output"""
+        return [(self.path, None)] + [(locationPath(self.path, location), location)
+                for location in sorted(self.locations)]
+
+    def finish(self):
+        self.file.close()
+        for location in sorted(set(self.used) - self.locations):
+            print("Dropping {} records for location {!r}, which no '%' line assigns".format(
+                self.used[location], location), file=sys.stderr)
+        outputs = self.outputs()
+        files = []
+        try:
+            for path, location in outputs:
+                files.append(OutputFile(path, self.text))
+            # The records for everyone go to every output (for databases,
+            # hashed and packed just once), the others only to their
+            # location's
+            everyone = [f.add if self.text else f.out.addPacked for f in files]
+            adds = {location: f.add for (path, location), f in zip(outputs, files) if location is not None}
+            counts = collections.Counter()
+            for key, value in spooledRecords(self.spool):
+                location = recordLocation(key, value)
+                if location is None:
+                    if self.text:
+                        for add in everyone:
+                            add(key, value)
+                    else:
+                        h = cdb_hash(key)
+                        record = struct.pack('<LL', len(key), len(value)) + key + value
+                        for add in everyone:
+                            add(h, record)
+                else:
+                    add = adds.get(location)
+                    if add is not None:
+                        add(key, value)
+                counts[location] += 1
+        except BaseException:
+            for f in files:
+                f.abort()
+            raise
+        finally:
+            os.unlink(self.spool)
+        for f in files:
+            f.finish()
+        self.counts = {path: counts[None] + (counts[location] if location is not None else 0)
+                for path, location in outputs}
+
+def jumpHash(key, buckets):
+    """Jump consistent hash (Lamping and Veach): the bucket, out of buckets,
+    for the 64 bit key. Going from n to n + 1 buckets only moves 1/(n + 1) of
+    the keys, all of them to the new bucket.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xffffffffffffffff
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+def nameHash(dns_name):
+    return int.from_bytes(hashlib.blake2b(dns_name, digest_size=8).digest(), 'big')
+
+def zoneOf(dns_name, apexes):
+    """The longest of apexes (names in DNS format) that dns_name is in or
+    equal to, or None
+    """
+    pos = 0
+    while pos < len(dns_name):
+        if dns_name[pos:] in apexes:
+            return dns_name[pos:]
+        pos += dns_name[pos] + 1
+    return None
+
+def zoneFinder(apexes, cache_size=65536):
+    """A faster zoneOf(dns_name, apexes) for many names, remembering the
+    zones of the names above them (which most names share)
+    """
+    @functools.lru_cache(maxsize=cache_size)
+    def parentZone(parent):
+        return zoneOf(parent, apexes)
+    def zone(dns_name):
+        if dns_name in apexes:
+            return dns_name
+        if dns_name[:1] == b'\0':
+            return None
+        return parentZone(dns_name[dns_name[0] + 1:])
+    return zone
+
+def shardPath(path, shard, shards):
+    """The path of one shard, e.g. data.shard03.cdb for data.cdb"""
+    root, ext = os.path.splitext(path)
+    return "{}.shard{:0{}d}{}".format(root, shard, len(str(shards - 1)), ext)
+
+def fileSha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                return digest.hexdigest()
+            digest.update(data)
+
+def writeShard(spool, path, text=False):
+    """Write a shard from its spool, leaving path alone (timestamp and all)
+    if it already has exactly those contents. Returns (records, size,
+    sha256).
+    """
+    newpath = path + '.new'
+    count = writeSpooled(spool, newpath, text=text)
+    sha256 = fileSha256(newpath)
+    if os.path.exists(path) and fileSha256(path) == sha256:
+        os.unlink(newpath)
+    else:
+        os.rename(newpath, path)
+    return count, os.path.getsize(path), sha256
+
+class ZoneSharder(SpooledSink):
+    """Partitions the records into shards databases, for fleets where each
+    server only serves some of the zones.
+
+    By zone (by='zone'), all the records of a zone (the names at and below
+    the owner of an SOA record, from 'Z' or '.' lines, down to any zone
+    inside it) go to the same shard, picked by a consistent hash of the
+    apex; names in no zone are placed by their own hash. By name
+    (by='name'), each name is placed by its hash. '%' records go to every
+    shard. The shards are named after path (see shardPath), and a JSON
+    manifest (data.manifest.json for data.cdb) lists them with their sizes
+    and SHA-256 hashes, and the shard of each zone.
+
+    Shards whose contents didn't change are left untouched, so only changed
+    ones need to be shipped.
+    """
+    def __init__(self, path, shards, by='zone', text=False, jobs=1):
+        if shards < 1:
+            raise Exception("Need at least 1 shard (got {})".format(shards))
+        if by not in ('zone', 'name'):
+            raise Exception("Can't shard by {!r}".format(by))
+        super().__init__(path, text, jobs)
+        self.shards = shards
+        self.by = by
+        self.apexes = set()
+        self.manifest = os.path.splitext(path)[0] + '.manifest.json'
+
+    def note(self, key, value):
+        if value[:2] == b'\0\6':
+            self.apexes.add(key)
+
+    def shardOf(self, key):
+        if self.by == 'zone':
+            zone = zoneOf(key, self.apexes)
+            if zone is not None:
+                key = zone
+        return jumpHash(nameHash(key), self.shards)
+
+    def finish(self):
+        self.file.close()
+        paths = [shardPath(self.path, shard, self.shards) for shard in range(self.shards)]
+        spools = [path + '.spool' for path in paths]
+        try:
+            files = [open(spool, 'wb', buffering=1 << 20) for spool in spools]
+            try:
+                for key, value in spooledRecords(self.spool):
+                    if key[:2] == b'\0%':
+                        for f in files:
+                            spoolRecord(f, key, value)
+                    else:
+                        spoolRecord(files[self.shardOf(key)], key, value)
+            finally:
+                for f in files:
+                    f.close()
+            results = runJobs(self.jobs, writeShard, spools, paths, [self.text] * self.shards)
+        finally:
+            for spool in [self.spool] + spools:
+                if os.path.exists(spool):
+                    os.unlink(spool)
+        self.counts = {path: count for path, (count, size, sha256) in zip(paths, results)}
+        manifest = {
+            'shards': self.shards,
+            'by': self.by,
+            'files': [{'path': os.path.basename(path), 'records': count, 'size': size, 'sha256': sha256}
+                for path, (count, size, sha256) in zip(paths, results)],
+            'zones': {dns_to_name(apex)[0]: self.shardOf(apex) for apex in sorted(self.apexes)},
+            }
+        tmppath = self.manifest + '.tmp'
+        with open(tmppath, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.write('\n')
+        os.rename(tmppath, self.manifest)
+
+# The PowerDNS gsqlite3 schema (as of 4.x); the indexes are made after the
+# records are loaded, which is much faster than keeping them up to date
+PDNS_TABLES = [
+    """CREATE TABLE domains (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL COLLATE NOCASE,
+        master VARCHAR(128) DEFAULT NULL,
+        last_check INTEGER DEFAULT NULL,
+        type VARCHAR(8) NOT NULL,
+        notified_serial INTEGER DEFAULT NULL,
+        account VARCHAR(40) DEFAULT NULL,
+        options VARCHAR(65535) DEFAULT NULL,
+        catalog VARCHAR(255) DEFAULT NULL)""",
+    """CREATE TABLE records (
+        id INTEGER PRIMARY KEY,
+        domain_id INTEGER DEFAULT NULL,
+        name VARCHAR(255) DEFAULT NULL,
+        type VARCHAR(10) DEFAULT NULL,
+        content VARCHAR(65535) DEFAULT NULL,
+        ttl INTEGER DEFAULT NULL,
+        prio INTEGER DEFAULT NULL,
+        disabled BOOLEAN DEFAULT 0,
+        ordername VARCHAR(255),
+        auth BOOL DEFAULT 1,
+        FOREIGN KEY(domain_id) REFERENCES domains(id) ON DELETE CASCADE ON UPDATE CASCADE)""",
+    """CREATE TABLE supermasters (
+        ip VARCHAR(64) NOT NULL,
+        nameserver VARCHAR(255) NOT NULL COLLATE NOCASE,
+        account VARCHAR(40) NOT NULL,
+        PRIMARY KEY (ip, nameserver))""",
+    """CREATE TABLE comments (
+        id INTEGER PRIMARY KEY,
+        domain_id INTEGER NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        type VARCHAR(10) NOT NULL,
+        modified_at INT NOT NULL,
+        account VARCHAR(40) DEFAULT NULL,
+        comment VARCHAR(65535) NOT NULL,
+        FOREIGN KEY(domain_id) REFERENCES domains(id) ON DELETE CASCADE ON UPDATE CASCADE)""",
+    """CREATE TABLE domainmetadata (
+        id INTEGER PRIMARY KEY,
+        domain_id INT NOT NULL,
+        kind VARCHAR(32) COLLATE NOCASE,
+        content TEXT,
+        FOREIGN KEY(domain_id) REFERENCES domains(id) ON DELETE CASCADE ON UPDATE CASCADE)""",
+    """CREATE TABLE cryptokeys (
+        id INTEGER PRIMARY KEY,
+        domain_id INT NOT NULL,
+        flags INT NOT NULL,
+        active BOOL,
+        published BOOL DEFAULT 1,
+        content TEXT,
+        FOREIGN KEY(domain_id) REFERENCES domains(id) ON DELETE CASCADE ON UPDATE CASCADE)""",
+    """CREATE TABLE tsigkeys (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(255) COLLATE NOCASE,
+        algorithm VARCHAR(50) COLLATE NOCASE,
+        secret VARCHAR(255))""",
+    ]
+PDNS_INDEXES = [
+    "CREATE UNIQUE INDEX name_index ON domains(name)",
+    "CREATE INDEX catalog_idx ON domains(catalog)",
+    "CREATE INDEX records_lookup_idx ON records(name, type)",
+    "CREATE INDEX records_lookup_id_idx ON records(domain_id, name, type)",
+    "CREATE INDEX records_order_idx ON records(domain_id, ordername)",
+    "CREATE INDEX comments_idx ON comments(domain_id, name, type)",
+    "CREATE INDEX comments_order_idx ON comments(domain_id, modified_at)",
+    "CREATE INDEX domainmetaidindex ON domainmetadata(domain_id)",
+    "CREATE INDEX domainidindex ON cryptokeys(domain_id)",
+    "CREATE UNIQUE INDEX namealgoindex ON tsigkeys(name, algorithm)",
+    ]
+
+def pdnsName(data, pos=0):
+    """Decode the name at pos in data the way PowerDNS stores names (lower
+    case, without the trailing '.'), returning it and the position after it
+    """
+    name, pos = dns_to_name(data, pos)
+    return name[:-1].lower() or '.', pos
+
+def pdnsContent(type_, rdata):
+    """The content column of a PowerDNS record: the data as in a zone file,
+    with the names as PowerDNS stores them
+    """
+    if type_ in (RR_TYPE_NS, RR_TYPE_CNAME, RR_TYPE_PTR):
+        return pdnsName(rdata)[0]
+    elif type_ == RR_TYPE_MX:
+        return '{} {}'.format(MX_NUMBERS.unpack_from(rdata)[0], pdnsName(rdata, 2)[0])
+    elif type_ == RR_TYPE_SRV:
+        return '{} {} {} {}'.format(*SRV_NUMBERS.unpack_from(rdata), pdnsName(rdata, 6)[0])
+    elif type_ == RR_TYPE_SOA:
+        mname, pos = pdnsName(rdata)
+        rname, pos = pdnsName(rdata, pos)
+        return '{} {} {} {} {} {} {}'.format(mname, rname, *SOA_NUMBERS.unpack_from(rdata, pos))
+    return decodeRdata(type_, rdata)
+
+class PowerDnsWriter(SpooledSink):
+    """Writes the records into a PowerDNS gsqlite3 database at path, for
+    secondaries that would otherwise have to AXFR everything.
+
+    Each SOA owner (from 'Z' and '.' lines) becomes a NATIVE domain, and each
+    record goes in the domain it's in (the longest apex above it); records in
+    no domain are left out, with a warning. NS records below an apex, and
+    everything under them, are marked as not authoritative, like 'pdnsutil
+    rectify-zone' would. PowerDNS has no locations: the records for
+    location (if given) are written along with the records for everyone, and
+    those for other locations are left out. Nor does it have timestamps:
+    records with a TTD are written as tinydns would serve them now (see
+    servedTtl), or left out if it wouldn't.
+
+    The database is built from scratch next to path, in one transaction with
+    the rows inserted batch rows at a time, and renamed over path once it's
+    complete, so PowerDNS never sees it half loaded.
+    """
+    def __init__(self, path, location=None, batch=10000):
+        super().__init__(path)
+        self.location = location
+        self.batch = batch
+        self.apexes = set()
+        self.servers = set()
+        self.dropped = collections.Counter()
+
+    def note(self, key, value):
+        if value[:2] == b'\0\6':
+            self.apexes.add(bytes(key).lower())
+        elif value[:2] == b'\0\2':
+            self.servers.add(bytes(key).lower())
+
+    def owner(self, name, findZone, domains, cuts):
+        """(domain id, name as PowerDNS stores it, delegation) for an owner
+        name, or None if it's in no domain. delegation is 'at' for a name
+        with NS records below the apex, 'below' for names under one, and
+        None otherwise.
+        """
+        apex = findZone(name)
+        if apex is None:
+            return None
+        delegation = None
+        pos = 0
+        while pos < len(name) - len(apex):
+            if name[pos:] in cuts:
+                delegation = 'below' if pos else 'at'
+                break
+            pos += name[pos] + 1
+        return domains[apex], pdnsName(name)[0], delegation
+
+    def rows(self, domains):
+        """Yield the records row of each record in the spool"""
+        cuts = self.servers - self.apexes
+        # Records of the same name tend to come together
+        findZone = zoneFinder(self.apexes)
+        owner = functools.lru_cache(maxsize=4096)(
+                lambda name: self.owner(name, findZone, domains, cuts))
+        now = taiNow()
+        for key, value in spooledRecords(self.spool):
+            if key[:2] == b'\0%':
+                continue
+            type_, loc, ttl, ttd, rdata = decodeValue(value)
+            if loc is not None and loc != self.location:
+                self.dropped['for other locations'] += 1
+                continue
+            ttl = servedTtl(ttl, ttd, now)
+            if ttl is None:
+                self.dropped['not valid now (TTD)'] += 1
+                continue
+            info = owner(bytes(key).lower())
+            if info is None:
+                self.dropped['in no zone'] += 1
+                continue
+            domain, name, delegation = info
+            # Everything at a delegation but its DS records (which belong to
+            # this zone) is delegated away, as is everything under it
+            auth = 0 if delegation == 'below' or (delegation == 'at' and type_ != RR_TYPE_DS) else 1
+            yield (domain, name, rrTypeName(type_), pdnsContent(type_, rdata), ttl, 0, auth)
+
+    def finish(self):
+        self.file.close()
+        tmppath = self.path + '.tmp'
+        try:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            db = sqlite3.connect(tmppath, isolation_level=None)
+            try:
+                db.execute("PRAGMA journal_mode = OFF")
+                db.execute("PRAGMA synchronous = OFF")
+                db.execute("BEGIN")
+                for table in PDNS_TABLES:
+                    db.execute(table)
+                apexes = sorted(self.apexes)
+                domains = {apex: id_ for id_, apex in enumerate(apexes, 1)}
+                db.executemany("INSERT INTO domains (id, name, type) VALUES (?, ?, 'NATIVE')",
+                        [(domains[apex], pdnsName(apex)[0]) for apex in apexes])
+                count = 0
+                rows = self.rows(domains)
+                while True:
+                    batch = list(itertools.islice(rows, self.batch))
+                    if not batch:
+                        break
+                    db.executemany("INSERT INTO records (domain_id, name, type, content, ttl, prio, auth) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+                    count += len(batch)
+                for index in PDNS_INDEXES:
+                    db.execute(index)
+                db.execute("COMMIT")
+                db.execute("ANALYZE")
+            finally:
+                db.close()
+            os.replace(tmppath, self.path)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.unlink(tmppath)
+            raise
+        finally:
+            os.unlink(self.spool)
+        for reason, dropped in sorted(self.dropped.items()):
+            print("Left out {} records {}".format(dropped, reason), file=sys.stderr)
+        self.counts = {self.path: count}
+
+def zonePath(directory, apex, format='zone'):
+    """The path of the file for the zone apex (in DNS format), e.g.
+    example.com.zone in directory
+    """
+    name = dns_to_name(apex)[0][:-1] or 'root'
+    if '/' in name or name.startswith('.'):
+        raise Exception("Zone {!r} can't be used in a file name".format(name))
+    return os.path.join(directory, '{}.{}'.format(name, format))
+
+ZONE_RECORD = struct.Struct('>HL') # type, TTL
+AXFR_HEADER = struct.Struct('>HHHHHH') # id, flags, qdcount, ancount, nscount, arcount
+AXFR_RR = struct.Struct('>HHLH') # type, class, TTL, rdlength
+
+def zoneRecords(spill, soa):
+    """Yield the (name, type, TTL, rdata) records of a zone: soa (the key
+    and value of its SOA record, as spilled) and then the records of the
+    spill file, if any
+    """
+    yield (soa[0],) + ZONE_RECORD.unpack_from(soa[1]) + (soa[1][ZONE_RECORD.size:],)
+    if os.path.exists(spill):
+        for key, value in spooledRecords(spill):
+            yield (bytes(key),) + ZONE_RECORD.unpack_from(value) + (bytes(value[ZONE_RECORD.size:]),)
+
+def axfrMessages(apex, records, size=65535):
+    """Yield the messages of an AXFR response for apex with records (the
+    first of which is the SOA), each up to size bytes. Names aren't
+    compressed.
+    """
+    question = apex + struct.pack('>HH', RR_TYPE_AXFR, 1)
+    message = []
+    length = AXFR_HEADER.size + len(question)
+    for name, type_, ttl, rdata in records:
+        rr = name + AXFR_RR.pack(type_, 1, ttl, len(rdata)) + rdata
+        if message and length + len(rr) > size:
+            yield AXFR_HEADER.pack(0, 0x8400, 1 if question else 0, len(message), 0, 0) + question + b''.join(message)
+            question = b''
+            message = []
+            length = AXFR_HEADER.size
+        message.append(rr)
+        length += len(rr)
+    yield AXFR_HEADER.pack(0, 0x8400, 1 if question else 0, len(message), 0, 0) + question + b''.join(message)
+
+def writeZone(spill, path, soa, format='zone'):
+    """Write the zone file (or, for the 'axfr' format, AXFR stream) of a zone
+    from its SOA and spill file (see ZoneFileWriter). Returns the number of
+    records written, counting the SOA once.
+    """
+    tmppath = path + '.tmp'
+    count = 0
+    try:
+        with open(tmppath, 'wb', buffering=1 << 20) as f:
+            if format == 'axfr':
+                # The SOA starts and ends the transfer
+                counter = itertools.count()
+                records = (record for record, n in zip(zoneRecords(spill, soa), counter))
+                for message in axfrMessages(soa[0], itertools.chain(records, [next(zoneRecords(spill, soa))])):
+                    f.write(U16.pack(len(message)))
+                    f.write(message)
+                count = next(counter)
+            else:
+                f.write('; {} from tinydns data\n'.format(dns_to_name(soa[0])[0]).encode())
+                for name, type_, ttl, rdata in zoneRecords(spill, soa):
+                    f.write('{}\t{}\tIN\t{}\t{}\n'.format(dns_to_name(name)[0], ttl, rrTypeName(type_),
+                            decodeRdata(type_, rdata)).encode())
+                    count += 1
+        os.rename(tmppath, path)
+    except BaseException:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+    return count
+
+class ZoneFileWriter(SpooledSink):
+    """Writes a file per zone into directory: an RFC 1035 zone file
+    (format='zone', e.g. example.com.zone) or an AXFR response as it would
+    be sent over TCP (format='axfr', e.g. example.com.axfr), for secondaries
+    that don't read tinydns data.
+
+    The zones are the owners of SOA records ('Z' and '.' lines), and each
+    record goes in the zone it's in (the longest apex above it). NS records
+    at the apex of a zone inside another, along with the A and AAAA records
+    of the servers they name under that apex, go in both, so the outer zone
+    delegates to the inner one. Records in no zone, for other locations
+    than location, or (with a TTD) not served at the time of the build are
+    left out, as for PowerDnsWriter. The SOA comes first (and, for AXFR,
+    last too), then the records in the order of the data.
+
+    The records are spooled, then spilled to a file per zone, from which the
+    zone files are written in a pool of jobs processes. Records being
+    spilled are buffered, up to buffer_size bytes in all, and each zone's
+    are appended to its file in one go whenever the buffers fill up, so
+    memory stays bounded however many zones and records there are.
+    """
+    def __init__(self, directory, format='zone', location=None, jobs=1, buffer_size=64 << 20):
+        if format not in ('zone', 'axfr'):
+            raise Exception("Can't write zones as {!r}".format(format))
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(os.path.join(directory, '.records'), jobs=jobs)
+        self.directory = directory
+        self.format = format
+        self.location = location
+        self.buffer_size = buffer_size
+        self.now = taiNow()
+        self.apexes = set()
+        # (name, server) of each NS record
+        self.servers = set()
+        self.dropped = collections.Counter()
+
+    def served(self, value):
+        """(type, TTL, rdata) of a record as written to zone files, or None
+        if it's left out
+        """
+        type_, loc, ttl, ttd, rdata = decodeValue(value)
+        if loc is not None and loc != self.location:
+            return None
+        ttl = servedTtl(ttl, ttd, self.now)
+        if ttl is None:
+            return None
+        return type_, ttl, rdata
+
+    def note(self, key, value):
+        if value[:2] == b'\0\6' and self.served(value) is not None:
+            self.apexes.add(bytes(key).lower())
+        elif value[:2] == b'\0\2' and key[:2] != b'\0%':
+            record = self.served(value)
+            if record is not None:
+                self.servers.add((bytes(key).lower(), bytes(record[2]).lower()))
+
+    def delegations(self, findZone):
+        """Return {apex: outer apex} for zones inside others that the outer
+        zone has NS records for, and {name: outer apexes} for the names of
+        their servers under their apexes. findZone is the zoneOf() to use.
+        """
+        delegations = {}
+        glue = collections.defaultdict(set)
+        for name, target in self.servers:
+            if name not in self.apexes or name == b'\0':
+                continue
+            outer = findZone(name[name[0] + 1:])
+            if outer is None:
+                continue
+            delegations[name] = outer
+            if zoneOf(target, {name}) is not None:
+                glue[target].add(outer)
+        return delegations, glue
+
+    def spill(self, buffers, spills):
+        """Append the buffered records of each zone to its spill file"""
+        for zone, buffer in buffers.items():
+            with open(spills[zone], 'ab') as f:
+                f.write(buffer)
+        buffers.clear()
+
+    def finish(self):
+        self.file.close()
+        spilldir = tempfile.mkdtemp(prefix='.spill', dir=self.directory)
+        try:
+            apexes = sorted(self.apexes)
+            spills = {apex: os.path.join(spilldir, '{}.spill'.format(i)) for i, apex in enumerate(apexes)}
+            soas = {}
+            findZone = zoneFinder(self.apexes)
+            delegations, glue = self.delegations(findZone)
+            buffers = collections.defaultdict(bytearray)
+            buffered = 0
+            for key, value in spooledRecords(self.spool):
+                if key[:2] == b'\0%':
+                    continue
+                record = self.served(value)
+                if record is None:
+                    self.dropped['for other locations or not valid now (TTD)'] += 1
+                    continue
+                key = bytes(key).lower()
+                apex = findZone(key)
+                if apex is None:
+                    self.dropped['in no zone'] += 1
+                    continue
+                type_, ttl, rdata = record
+                value = ZONE_RECORD.pack(type_, ttl) + rdata
+                if type_ == RR_TYPE_SOA:
+                    if key != apex or apex in soas:
+                        self.dropped['given as extra SOA records'] += 1
+                    else:
+                        soas[apex] = (key, value)
+                    continue
+                zones = [apex]
+                if type_ == RR_TYPE_NS and key in delegations:
+                    zones.append(delegations[key])
+                elif type_ in (RR_TYPE_A, RR_TYPE_AAAA) and key in glue:
+                    zones.extend(glue[key])
+                # As spoolRecord would write it
+                entry = struct.pack('<LL', len(key), len(value)) + key + value
+                for zone in zones:
+                    buffers[zone] += entry
+                buffered += len(entry) * len(zones)
+                if buffered > self.buffer_size:
+                    self.spill(buffers, spills)
+                    buffered = 0
+            self.spill(buffers, spills)
+            paths = [zonePath(self.directory, apex, self.format) for apex in apexes]
+            counts = runJobs(self.jobs, writeZone, [spills[apex] for apex in apexes], paths,
+                    [soas[apex] for apex in apexes], [self.format] * len(apexes))
+        finally:
+            shutil.rmtree(spilldir, ignore_errors=True)
+            os.unlink(self.spool)
+        for reason, dropped in sorted(self.dropped.items()):
+            print("Left out {} records {}".format(dropped, reason), file=sys.stderr)
+        self.counts = dict(zip(paths, counts))
+
+rr_type_names = {
+    value: name[len('RR_TYPE_'):] for name, value in globals().items() if name.startswith('RR_TYPE_')
+    }
+rr_type_numbers = {name: value for value, name in rr_type_names.items()}
+
+def rrTypeName(type_):
+    return rr_type_names.get(type_, "TYPE{}".format(type_))
+
+def rrTypeNumber(name):
+    """The type number for a name like 'MX', 'TYPE15' or '15'"""
+    name = name.upper()
+    if name in rr_type_numbers:
+        return rr_type_numbers[name]
+    if name.startswith('TYPE'):
+        name = name[4:]
+    return int(name)
+
+def decodeValue(value):
+    """Split the value of a record (as made by make_record) into
+    (type, loc, ttl, ttd, rdata); loc is None for records without one.
+    """
+    if value[2:3] == b'>':
+        type_, _, loc, ttl, ttd = RECORD_HEADER_LOC.unpack_from(value)
+        return type_, bytes(loc).decode('ascii', 'backslashreplace'), ttl, ttd, value[RECORD_HEADER_LOC.size:]
+    type_, _, ttl, ttd = RECORD_HEADER.unpack_from(value)
+    return type_, None, ttl, ttd, value[RECORD_HEADER.size:]
+
+def taiNow():
+    """The current time as a TAI64 label, the form TTDs are given in"""
+    return (1 << 62) + 10 + int(time.time())
+
+def servedTtl(ttl, ttd, now):
+    """The TTL tinydns would give a record at now (a TAI64 time), or None if
+    it wouldn't serve it at all. A record with a TTD and a TTL of 0 is
+    served until the TTD, with a TTL counting down to it; one with a TTD and
+    a TTL isn't served until the TTD.
+    """
+    if not ttd:
+        return ttl
+    if ttl == 0:
+        if ttd <= now:
+            return None
+        return max(2, min(ttd - now, 3600))
+    if ttd > now:
+        return None
+    return ttl
+
+escape_patterns = {}
+
+def escapeText(data, special=b'"\\'):
+    """Present bytes as text, escaping special characters with a backslash and
+    unprintable ones as \\DDD (decimal, as in zone files)
+    """
+    pattern = escape_patterns.get(special)
+    if pattern is None:
+        pattern = escape_patterns[special] = re.compile(b'[^\x20-\x7e]|[' + re.escape(special) + b']')
+    data = bytes(data)
+    if pattern.search(data) is None:
+        # Nothing to escape, as in most names and texts
+        return data.decode('ascii')
+    res = []
+    for c in data:
+        if c < 0x20 or c >= 0x7f:
+            res.append('\\{:03d}'.format(c))
+        elif c in special:
+            res.append('\\' + chr(c))
+        else:
+            res.append(chr(c))
+    return ''.join(res)
+
+def dns_to_name(data, pos=0):
+    """Decode the (uncompressed) domain name at pos in data, returning the
+    name in presentation format (with the trailing '.') and the position after
+    it.
+    """
+    labels = []
+    while True:
+        l = data[pos]
+        pos += 1
+        if l == 0:
+            break
+        labels.append(escapeText(data[pos:pos + l], b'."\\'))
+        pos += l
+    return '.'.join(labels) + '.', pos
+
+def dns_to_strings(data, pos=0, end=None):
+    """Decode the character-strings from pos to end, as a list of bytes"""
+    if end is None:
+        end = len(data)
+    strings = []
+    while pos < end:
+        l = data[pos]
+        strings.append(bytes(data[pos + 1:pos + 1 + l]))
+        pos += 1 + l
+    return strings
+
+def quoteText(data):
+    return '"' + escapeText(data) + '"'
+
+def svcbParamName(key):
+    for name, num in svcb_keys.items():
+        if num == key:
+            return name
+    return "key{}".format(key)
+
+def decodeSvcbParams(data, pos):
+    params = []
+    while pos < len(data):
+        key, length = struct.unpack_from('>HH', data, pos)
+        pos += 4
+        value = bytes(data[pos:pos + length])
+        pos += length
+        name = svcbParamName(key)
+        if key == 0:
+            params.append(name + '=' + ','.join(
+                svcbParamName(k) for k in struct.unpack('>{}H'.format(length // 2), value)))
+        elif key == 1:
+            params.append(name + '=' + ','.join(escapeText(s, b'",\\') for s in dns_to_strings(value)))
+        elif key == 2:
+            params.append(name)
+        elif key == 3:
+            params.append('{}={}'.format(name, struct.unpack('>H', value)[0]))
+        elif key == 4:
+            params.append(name + '=' + ','.join(
+                '.'.join(map(str, value[i:i + 4])) for i in range(0, length, 4)))
+        elif key == 6:
+            params.append(name + '=' + ','.join(
+                str(ipaddress.IPv6Address(value[i:i + 16])) for i in range(0, length, 16)))
+        else:
+            params.append('{}={}'.format(name, quoteText(value)))
+    return params
+
+def decodeRdata(type_, rdata):
+    """Present the rdata of a record the way it would appear in a zone file.
+    Types this doesn't know (or rdata it can't make sense of) are given in
+    the generic RFC 3597 form.
+    """
+    rdata = bytes(rdata)
+    try:
+        if type_ == RR_TYPE_A and len(rdata) == 4:
+            return '.'.join(map(str, rdata))
+        elif type_ == RR_TYPE_AAAA and len(rdata) == 16:
+            return str(ipaddress.IPv6Address(rdata))
+        elif type_ in (RR_TYPE_NS, RR_TYPE_CNAME, RR_TYPE_PTR):
+            return dns_to_name(rdata)[0]
+        elif type_ == RR_TYPE_MX:
+            return '{} {}'.format(MX_NUMBERS.unpack_from(rdata)[0], dns_to_name(rdata, 2)[0])
+        elif type_ == RR_TYPE_SOA:
+            mname, pos = dns_to_name(rdata)
+            rname, pos = dns_to_name(rdata, pos)
+            return '{} {} {} {} {} {} {}'.format(mname, rname, *SOA_NUMBERS.unpack_from(rdata, pos))
+        elif type_ == RR_TYPE_TXT:
+            return ' '.join(quoteText(s) for s in dns_to_strings(rdata))
+        elif type_ == RR_TYPE_SRV:
+            return '{} {} {} {}'.format(*SRV_NUMBERS.unpack_from(rdata), dns_to_name(rdata, 6)[0])
+        elif type_ == RR_TYPE_NAPTR:
+            order, preference = struct.unpack_from('>HH', rdata)
+            pos = 4
+            strings = []
+            for i in range(3):
+                strings.append(quoteText(rdata[pos + 1:pos + 1 + rdata[pos]]))
+                pos += 1 + rdata[pos]
+            return '{} {} {} {}'.format(order, preference, ' '.join(strings), dns_to_name(rdata, pos)[0])
+        elif type_ == RR_TYPE_CAA:
+            taglen = rdata[1]
+            return '{} {} {}'.format(rdata[0], escapeText(rdata[2:2 + taglen]), quoteText(rdata[2 + taglen:]))
+        elif type_ == RR_TYPE_TLSA:
+            return '{} {} {} {}'.format(rdata[0], rdata[1], rdata[2], rdata[3:].hex())
+        elif type_ == RR_TYPE_DS:
+            return '{} {} {} {}'.format(U16.unpack_from(rdata)[0], rdata[2], rdata[3], rdata[4:].hex())
+        elif type_ == RR_TYPE_SSHFP:
+            return '{} {} {}'.format(rdata[0], rdata[1], rdata[2:].hex())
+        elif type_ in (RR_TYPE_SVCB, RR_TYPE_HTTPS):
+            target, pos = dns_to_name(rdata, 2)
+            return ' '.join(['{} {}'.format(U16.unpack_from(rdata)[0], target)] + decodeSvcbParams(rdata, pos))
+    except (IndexError, struct.error, ValueError):
+        pass
+    return '\\# {} {}'.format(len(rdata), rdata.hex()).rstrip()
+
+def describeRecord(key, value):
+    """Present a record from the database as a line of text:
+    name, type, TTL, TTD (hex), location ('-' for none) and data
+    """
+    key = bytes(key)
+    if key[:2] == b'\0%':
+        return '{}\t%\t{}'.format('.'.join(map(str, key[2:])), escapeText(value))
+    type_, loc, ttl, ttd, rdata = decodeValue(value)
+    return '{}\t{}\t{}\t{:x}\t{}\t{}'.format(dns_to_name(key)[0], rrTypeName(type_), ttl, ttd,
+            loc or '-', decodeRdata(type_, rdata))
+
+class SubDelegations4:
+    """The IPv4 sub-delegations ('/' lines) seen so far, indexed by /24 so
+    looking up the ones covering an address doesn't scan all of them.
+
+    Each delegation is ((start, end), target, octets). Lookups return the
+    matching (target, octets) in the order the delegations were added.
+    """
+    def __init__(self, delegations=()):
+        self.delegations = []
+        self.buckets = {}
+        for delegation in delegations:
+            self.append(delegation)
+
+    def append(self, delegation):
+        range_, target, octets = delegation
+        start, end = range_
+        self.delegations.append(delegation)
+        for bucket in range(start >> 8, (end >> 8) + 1):
+            self.buckets.setdefault(bucket, []).append((start, end, target, octets))
+
+    def lookup(self, address):
+        bucket = self.buckets.get(address >> 8)
+        if bucket is None:
+            return []
+        return [(target, octets) for start, end, target, octets in bucket
+                if start <= address and address <= end]
+
+    def __iter__(self):
+        return iter(self.delegations)
+
+    def __len__(self):
+        return len(self.delegations)
+
+class SubDelegations6:
+    """The IPv6 sub-delegations ('/' lines) seen so far, in a trie of the
+    hex digits (nibbles) of their prefixes, so looking up the ones covering
+    an address takes at most one step per nibble.
+
+    Each delegation is (prefix, target, nibbles, cnames), with the prefix as
+    hex digits, nibbles the number of (host) nibbles kept in front of the
+    target, and cnames whether to link the ip6.arpa names of the addresses
+    to their PTR records with CNAMEs. Lookups return the matching (target,
+    nibbles, cnames) in the order the delegations were added.
+    """
+    def __init__(self, delegations=()):
+        self.delegations = []
+        # hex digit -> child node; the None key holds the delegations ending
+        # at a node, as (order added, target, nibbles, cnames)
+        self.root = {}
+        for delegation in delegations:
+            self.append(delegation)
+
+    def append(self, delegation):
+        prefix, target, nibbles, cnames = delegation
+        node = self.root
+        for digit in prefix:
+            node = node.setdefault(digit, {})
+        node.setdefault(None, []).append((len(self.delegations), target, nibbles, cnames))
+        self.delegations.append(delegation)
+
+    def lookup(self, address):
+        """Delegations covering address, given as 16 bytes"""
+        if not self.delegations:
+            return []
+        found = []
+        node = self.root
+        for digit in address.hex():
+            node = node.get(digit)
+            if node is None:
+                break
+            if None in node:
+                found.extend(node[None])
+        if len(found) > 1:
+            found.sort()
+        return [(target, nibbles, cnames) for order, target, nibbles, cnames in found]
+
+    def __iter__(self):
+        return iter(self.delegations)
+
+    def __len__(self):
+        return len(self.delegations)
+
+# The reversed nibbles of a byte as the labels of an ip6.arpa name, e.g.
+# 0x2a -> '\x01a\x012', and the names the reversed nibbles go in front of
+NIBBLE_LABELS = [bytes((1, ord('{:x}'.format(b & 0xf)), 1, ord('{:x}'.format(b >> 4)))) for b in range(256)]
+IP6_ARPA = labels_to_dns(['ip6', 'arpa'])
+IP6_INT = labels_to_dns(['ip6', 'int'])
+
+class Intent:
+    """How to turn the fields of one type of data line into records.
+
+    defaults are the values of omitted or empty fields, and parsers the
+    function (e.g. int) used to convert each field before it's given to
+    encode, or None to pass the field on as a string. encode is called with
+    the Compiler and the fields as arguments and returns (or yields) the
+    records.
+    """
+    def __init__(self, defaults, parsers, encode):
+        if len(parsers) != len(defaults):
+            raise Exception("parsers and defaults must cover the same fields")
+        self.defaults = defaults
+        self.parsers = [(i, parse) for i, parse in enumerate(parsers) if parse is not None]
+        self.encode = encode
+
+    def process(self, compiler, line):
+        fields = overlay(line.split(':'), self.defaults)
+        for i, parse in self.parsers:
+            fields[i] = parse(fields[i])
+        return self.encode(compiler, *fields)
+
+# The intents, by the first character of their data lines
+intents = {}
+
+def registerIntent(rtype, defaults, parsers, encode):
+    """Add (or replace) the intent for data lines starting with rtype"""
+    if len(rtype) != 1:
+        raise Exception("Intent type must be a single character (got {!r})".format(rtype))
+    intents[rtype] = Intent(defaults, parsers, encode)
+
+def intent(rtype, defaults, parsers):
+    """Decorator form of registerIntent"""
+    def register(encode):
+        registerIntent(rtype, defaults, parsers, encode)
+        return encode
+    return register
+
+loaded_plugins = []
+
+def loadPlugin(name):
+    """Load a plugin, given as a module name or the path of a .py file, and
+    call its register() function with this module so it can add intents
+    (see registerIntent).
+    """
+    if name.endswith('.py'):
+        modname = os.path.splitext(os.path.basename(name))[0]
+        spec = importlib.util.spec_from_file_location(modname, name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(name)
+    module.register(sys.modules[__name__])
+    loaded_plugins.append(name)
+
+def int16(text):
+    return int(text, 16)
+
+@intent('+', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeAddress(compiler, name, address, ttl, ttd, loc):
+    data = ipv4_to_bytes(address)
+    yield make_record(name, RR_TYPE_A, loc, ttl, ttd, data)
+
+@intent('3', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeAddress6(compiler, name, address, ttl, ttd, loc):
+    data = ipv6_to_bytes(address)
+    yield make_record(name, RR_TYPE_AAAA, loc, ttl, ttd, data)
+
+@intent('=', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeAddressWithPtr(compiler, name, address, ttl, ttd, loc):
+    # First, the A record
+    data = ipv4_to_bytes(address)
+    yield make_record(name, RR_TYPE_A, loc, ttl, ttd, data)
+    # Next, the PTR record
+    yield from compiler.makeReverseRecords4(address, name, loc, ttl, ttd)
+
+@intent('6', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeAddress6WithPtr(compiler, name, address, ttl, ttd, loc):
+    # AAAA record
+    data = ipv6_to_bytes(address)
+    yield make_record(name, RR_TYPE_AAAA, loc, ttl, ttd, data)
+    yield from compiler.makeReverseRecords6(data, name, loc, ttl, ttd)
+
+# Disabled A record
+registerIntent('-', [], [], lambda compiler: ())
+
+@intent('^', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodePtr(compiler, name, destname, ttl, ttd, loc):
+    data = name_to_dns(destname)
+    yield make_record(name, RR_TYPE_PTR, loc, ttl, ttd, data)
+
+@intent('C', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeCname(compiler, name, destname, ttl, ttd, loc):
+    # CNAME (like PTR)
+    data = name_to_dns(destname)
+    yield make_record(name, RR_TYPE_CNAME, loc, ttl, ttd, data)
+
+# The defaults are very round numbers in hex...
+# Note: Although the global default ttl is 86400 (1 day), the SOA
+# TTL defaults to 2560, like the minttl value. The serial defaults to the
+# timestamp of the data file.
+@intent('Z', [None, "", "", None, "16384", "2048", "1048576", "2560", "2560", "0", None],
+        [None, None, None, None, int, int, int, int, int, int16, None])
+def encodeSoa(compiler, name, primary, hostmaster, serial, refresh, retry, expire, minttl, ttl, ttd, loc):
+    # Zone (SOA)
+    primary = name_to_dns(primary)
+    hostmaster = name_to_dns(hostmaster)
+    if serial is None:
+        serial = compiler.serial
+    serial = int(serial)
+    data = primary + hostmaster + pack(SOA_NUMBERS, serial, refresh, retry, expire, minttl)
+    yield make_record(name, RR_TYPE_SOA, loc, ttl, ttd, data)
+
+def nsServerName(name, server):
+    if server == "":
+        return "ns." + name
+    elif not '.' in server:
+        return server + ".ns." + name
+    return server
+
+# Note: default TTL for NS is 3 days
+@intent('&', [None, "", "", "259200", "0", None], [None, None, None, int, int16, None])
+def encodeNs(compiler, name, address, server, ttl, ttd, loc):
+    # NS record
+    server = nsServerName(name, server)
+    data = name_to_dns(server)
+    yield make_record(name, RR_TYPE_NS, loc, ttl, ttd, data)
+    if address != "":
+        data = ipv4_to_bytes(address)
+        yield make_record(server, RR_TYPE_A, loc, ttl, ttd, data)
+
+@intent('.', [None, "", "", "259200", "0", None], [None, None, None, int, int16, None])
+def encodeSimpleSoa(compiler, name, address, server, ttl, ttd, loc):
+    # Simple SOA. Same format as &
+    server = nsServerName(name, server)
+    hostmaster = "hostmaster." + name
+
+    serial = compiler.serial
+    refresh = 0x4000
+    retry = 0x800
+    expire = 0x100000
+    minttl = 0xa00
+    primary = name_to_dns(server)
+    hostmaster = name_to_dns(hostmaster)
+    # SOA record. Note that original tinydns-data forces TTL of SOA to
+    # 2560 no matter what here. If you want custom TTL for SOA, you
+    # need a Z record.
+    data = primary + hostmaster + pack(SOA_NUMBERS, serial, refresh, retry, expire, minttl)
+    yield make_record(name, RR_TYPE_SOA, loc, 2560, ttd, data)
+    # NS record
+    data = name_to_dns(server)
+    yield make_record(name, RR_TYPE_NS, loc, ttl, ttd, data)
+    if address != "":
+        # A record
+        data = ipv4_to_bytes(address)
+        yield make_record(server, RR_TYPE_A, loc, ttl, ttd, data)
+
+@intent('@', [None, "", "", "0", default_TTL, "0", None], [None, None, None, int, int, int, None])
+def encodeMx(compiler, name, address, server, priority, ttl, ttd, loc):
+    # MX record
+    if server == "":
+        server = "mx." + name
+    elif not '.' in server:
+        server = server + ".mx." + name
+
+    lserver = name_to_dns(server)
+    # MX record
+    data = pack(MX_NUMBERS, priority) + lserver
+    yield make_record(name, RR_TYPE_MX, loc, ttl, ttd, data)
+    if address != "":
+        # A record
+        data = ipv4_to_bytes(address)
+        yield make_record(server, RR_TYPE_A, loc, ttl, ttd, data)
+
+@intent("'", [None, "", default_TTL, "0", None], [None, None, int, int, None])
+def encodeTxt(compiler, name, text, ttl, ttd, loc):
+    # TXT record
+    data = text_to_strings(deescape_text(text))
+    yield make_record(name, RR_TYPE_TXT, loc, ttl, ttd, data)
+
+@intent('S', [None, "", "", None, "1", "0", default_TTL, "0", None],
+        [None, None, None, int, int, int, int, int, None])
+def encodeSrv(compiler, name, address, server, port, priority, weight, ttl, ttd, loc):
+    # SRV record
+    lserver = name_to_dns(server)
+    data = pack(SRV_NUMBERS, priority, weight, port) + lserver
+    yield make_record(name, RR_TYPE_SRV, loc, ttl, ttd, data)
+    if address != "":
+        # TODO: support IPv6?
+        # A record
+        data = ipv4_to_bytes(address)
+        yield make_record(server, RR_TYPE_A, loc, ttl, ttd, data)
+
+@intent('N', [None, "", "0", "", "", "", "", default_TTL, "0", None],
+        [None, int, int, None, None, None, None, int, int, None])
+def encodeNaptr(compiler, name, order, preference, flags, service, regexp, replacement, ttl, ttd, loc):
+    # NAPTR record
+    flags = labels_to_dns([deescape_text(flags)])[:-1]
+    service = labels_to_dns([deescape_text(service)])[:-1]
+    regexp = labels_to_dns([deescape_text(regexp)])[:-1]
+    replacement = name_to_dns(replacement)
+
+    data = u16_to_bytes(order) + u16_to_bytes(preference) + flags + service + regexp + replacement
+    yield make_record(name, RR_TYPE_NAPTR, loc, ttl, ttd, data)
+
+@intent('c', [None, "0", "", "", default_TTL, "0", None], [None, int, None, None, int, int, None])
+def encodeCaa(compiler, name, flag, tag, value, ttl, ttd, loc):
+    # CAA record
+
+    # Tag needs to include length
+    tag = labels_to_dns([deescape_text(tag)])[:-1]
+    # Value does _NOT_ include length
+    value = deescape_text(value)
+
+    data = u8_to_bytes(flag) + tag + value
+    yield make_record(name, RR_TYPE_CAA, loc, ttl, ttd, data)
+
+@intent('t', [None, "", "", "", "", default_TTL, "0", None], [None, int, int, int, None, int, int, None])
+def encodeTlsa(compiler, name, usage, selector, match_type, cert_data, ttl, ttd, loc):
+    # TLSA record
+    cert_data = codecs.decode(cert_data, 'hex')
+
+    data = u8_to_bytes(usage) + u8_to_bytes(selector) + u8_to_bytes(match_type) + cert_data
+    yield make_record(name, RR_TYPE_TLSA, loc, ttl, ttd, data)
+
+@intent('d', [None, "", "", "", "", default_TTL, "0", None], [None, int, int, int, None, int, int, None])
+def encodeDs(compiler, name, tag, algorithm, digest_type, digest_data, ttl, ttd, loc):
+    # DS record
+    digest_data = codecs.decode(digest_data, 'hex')
+
+    data = u16_to_bytes(tag) + u8_to_bytes(algorithm) + u8_to_bytes(digest_type) + digest_data
+    yield make_record(name, RR_TYPE_DS, loc, ttl, ttd, data)
+
+@intent('s', [None, None, None, "", default_TTL, "0", None], [None, int, int, None, int, int, None])
+def encodeSshfp(compiler, name, algorithm, fingerprint_type, fingerprint_data, ttl, ttd, loc):
+    # SSHFP record
+    fingerprint_data = codecs.decode(fingerprint_data, 'hex')
+
+    data = u8_to_bytes(algorithm) + u8_to_bytes(fingerprint_type) + fingerprint_data
+    yield make_record(name, RR_TYPE_SSHFP, loc, ttl, ttd, data)
+
+svcb_keys = {
+    "mandatory": 0,
+    "alpn": 1,
+    "no-default-alpn": 2,
+    "port": 3,
+    "ipv4hint": 4,
+    "ipv6hint": 6,
+    }
+
+def svcbKeyNum(key):
+    if key in svcb_keys:
+        return svcb_keys[key]
+    elif key.startswith("key"):
+        return int(key[3:],10)
+    else:
+        raise Exception("Unknown SVCB param {}".format(key))
+
+def svcbKeyName(key):
+    for k,v in svcb_keys.items():
+        if key == v:
+            return "key{} ({})".format(key, k)
+    return "key{}".format(key)
+
+def svcbMandatoryKeys(value):
+    subkeynames = value.split(',')
+    subvalue = []
+    for subkeyname in subkeynames:
+        if subkeyname in svcb_keys:
+            subvalue.append(svcb_keys[subkeyname])
+        elif subkeyname.startswith("key"):
+            subvalue.append(int(subkeyname[3:],10))
+        else:
+            raise Exception("Unknown SVCB param in mandatory section: {}".format(subkeyname))
+    subvalue.sort()
+    if subvalue[0] == 0:
+        # See RFC 9460 §8
+        raise Exception("The 'mandatory' key must not appear in it's own list (either as mandatory or as 'key0')")
+    return subvalue
+
+def svcbAlpn(value):
+    subvalue = []
+    for subkeyname in value.split(','):
+        subkeyname = deescape_text(subkeyname)
+        if len(subkeyname) > 255:
+            raise Exception("Value too long: {}".format(subkeyname))
+        subvalue.append(u8_to_bytes(len(subkeyname)))
+        subvalue.append(subkeyname)
+    return b''.join(subvalue)
+
+def svcbNoDefaultAlpn(value):
+    if len(value):
+        raise Exception("no-default-alpn takes no value; but given {}".format(value))
+    return b''
+
+def svcbPort(value):
+    return u16_to_bytes(int(value))
+
+def svcbIpv4Hint(value):
+    return b''.join(ipv4_to_bytes(subvalue) for subvalue in value.split(','))
+
+def svcbIpv6Hint(value):
+    return b''.join(ipv6_to_bytes(subvalue) for subvalue in value.split(','))
+
+# How to encode the value of each known SVCB param; unknown 'keyN' params
+# are escaped text. 'mandatory' is handled by encodeSvcb itself since the
+# other params are checked against it.
+svcb_param_encoders = {
+    "alpn": svcbAlpn,
+    "no-default-alpn": svcbNoDefaultAlpn,
+    "port": svcbPort,
+    "ipv4hint": svcbIpv4Hint,
+    "ipv6hint": svcbIpv6Hint,
+    }
+
+def encodeSvcb(rrtype, name, destname, priority, params, ttl, ttd, loc):
+    if priority==0 and len(params) != 0:
+        # TODO: Warn? There is no param in current spec where this is valid. Can't make it an error since future specs could allow it
+        pass
+    paramset = {}
+    mandatories = []
+    for param in params.split(' '):
+        if len(param) == 0:
+            # empty params string or multiple spaces
+            continue
+        if '=' in param:
+            keyname,value = param.split('=',1)
+        else:
+            keyname,value = param, "" # Could do none if it becomes important do differentiate between an empty assignment and no assignment
+        key = svcbKeyNum(keyname)
+        if key in paramset:
+            raise Exception("Duplicate param {}".format(keyname))
+        if keyname == "mandatory":
+            # Save the set for final record validation
+            mandatories = svcbMandatoryKeys(value)
+            paramset[key] = b''.join(map(u16_to_bytes, mandatories))
+        elif keyname in svcb_param_encoders:
+            paramset[key] = svcb_param_encoders[keyname](value)
+        else:
+            paramset[key] = deescape_text(value)
+
+    paramdata = []
+    # Spec requires storage in ascending order by key
+    paramkeys = sorted(paramset.keys())
+    for key in paramkeys:
+        value = paramset[key]
+        paramdata.extend((u16_to_bytes(key), u16_to_bytes(len(value)), value))
+
+    data = u16_to_bytes(priority) + name_to_dns(destname) + b''.join(paramdata)
+    # Verify that all mandatory fields are actually present
+    for key in mandatories:
+        if not key in paramkeys:
+            raise Exception("{} listed as mandatory, but is not present in record".format(svcbKeyName(key)))
+        # TODO: Warn if rtype == 'H' and we found 'port' or 'no-default-alpn' listed in mandatory? These are 'SHOULD NOT' in the spec RFC9460§9¶5 and RFC9640§8¶8
+    yield make_record(name, rrtype, loc, ttl, ttd, data)
+
+@intent('V', [None, None, "0", "", default_TTL, "0", None], [None, None, int, None, int, int, None])
+def encodeSvcbRecord(compiler, name, destname, priority, params, ttl, ttd, loc):
+    # SVCB record
+    return encodeSvcb(RR_TYPE_SVCB, name, destname, priority, params, ttl, ttd, loc)
+
+@intent('H', [None, None, "0", "", default_TTL, "0", None], [None, None, int, None, int, int, None])
+def encodeHttpsRecord(compiler, name, destname, priority, params, ttl, ttd, loc):
+    # HTTPS record. Same format as SVCB
+    return encodeSvcb(RR_TYPE_HTTPS, name, destname, priority, params, ttl, ttd, loc)
+
+@intent(':', [None, None, "", default_TTL, "0", None], [None, int, None, int, int, None])
+def encodeRaw(compiler, name, rrtype, text, ttl, ttd, loc):
+    # raw record
+    if rrtype in [RR_TYPE_AXFR, RR_TYPE_SOA, RR_TYPE_NS, RR_TYPE_CNAME, RR_TYPE_PTR, RR_TYPE_MX, 0]:
+        # Note: I don't see a good reason why these are disallowed,
+        # but they are in DJB's documentation and implementation
+        raise Exception("RR type {} disallowed".format(rrtype))
+
+    data = deescape_text(text)
+    yield make_record(name, rrtype, loc, ttl, ttd, data)
+
+@intent('/', [None, None, "", "", default_TTL, "0", None], [None, None, None, None, int, int, None])
+def encodeSubDelegation(compiler, name, range_, nsname, nsaddr, ttl, ttd, loc):
+    # Sub-delegation type; modifies PTR generation and optionally
+    # creates appropriate CNAME, NS and the NS's A records
+    base, slash, prefix = range_.partition('/')
+    if slash and '.' not in base:
+        yield from encodeSubDelegation6(compiler, name, base, prefix, nsname, nsaddr, ttl, ttd, loc)
+        return
+    if '/' in range_:
+        # cidr
+        base, prefix = range_.split('/')
+        prefix = int(prefix)
+        if not ( 24 < prefix and prefix < 32):
+            raise Exception("only prefixes between 24 and 32 make sense")
+        parts = base.split('.')
+        if len(parts) != 4:
+            raise Exception("Malformed IP address in field 1")
+        addr = (int(parts[0]) << 24) | (int(parts[1]) << 16) | (int(parts[2]) << 8) | int(parts[3])
+        mask = (1 << (32 - prefix)) - 1
+        start = addr & ~mask
+        end = addr | mask
+    elif '-' in range_:
+        # plain range
+        parts = range_.split('.')
+        if len(parts) != 4:
+            raise Exception("Malformed IP address in field 1")
+        lsb_start, lsb_end = parts[3].split('-')
+        start = (int(parts[0]) << 24) | (int(parts[1]) << 16) | (int(parts[2]) << 8) | int(lsb_start)
+        end = (int(parts[0]) << 24) | (int(parts[1]) << 16) | (int(parts[2]) << 8) | int(lsb_end)
+    else:
+        raise Exception("Bad format for the range/cidr")
+    compiler.delegates4.append(((start,end), name, 1))
+    if len(nsname):
+        # Add CNAME records
+        for i in range(start, end + 1):
+            rtarget = "{}.{}.".format(i & 0xff, name)
+            rname = "{}.{}.{}.{}.in-addr.arpa.".format(
+                    i & 0xff,
+                    (i >> 8) & 0xff,
+                    (i >> 16) & 0xff,
+                    (i >> 24) & 0xff)
+            data = name_to_dns(rtarget)
+            yield make_record(rname, RR_TYPE_CNAME, loc, ttl, ttd, data)
+        if nsname != '.':
+            # do NS record
+            data = name_to_dns(nsname)
+            yield make_record(name, RR_TYPE_NS, loc, ttl, ttd, data)
+            if nsaddr != "":
+                data = ipv4_to_bytes(nsaddr)
+                yield make_record(nsname, RR_TYPE_A, loc, ttl, ttd, data)
+
+def encodeSubDelegation6(compiler, name, base, prefix, nsname, nsaddr, ttl, ttd, loc):
+    # The IPv6 form of '/', for a prefix of whole nibbles. A CNAME record
+    # for every address in the range is out of the question, so (with field
+    # 2 given, as for IPv4) each '6' line covered gets one instead, made
+    # along with its PTR record. The NS address may be IPv4 or IPv6 (32
+    # characters hex).
+    address = ipv6_to_bytes(base)
+    prefix = int(prefix)
+    if not (0 < prefix and prefix < 128) or prefix % 4:
+        raise Exception("IPv6 prefixes must be a multiple of 4 between 4 and 124")
+    digits = prefix // 4
+    compiler.delegates6.append((address.hex()[:digits], name, 32 - digits, len(nsname) > 0))
+    if len(nsname) and nsname != '.':
+        data = name_to_dns(nsname)
+        yield make_record(name, RR_TYPE_NS, loc, ttl, ttd, data)
+        if nsaddr != "":
+            if '.' in nsaddr:
+                yield make_record(nsname, RR_TYPE_A, loc, ttl, ttd, ipv4_to_bytes(nsaddr))
+            else:
+                yield make_record(nsname, RR_TYPE_AAAA, loc, ttl, ttd, ipv6_to_bytes(nsaddr))
+
+@intent('%', [None, ""], [None, None])
+def encodeLocation(compiler, name, prefix):
+    name = name.encode('ascii')
+    if len(name) != 2:
+        raise Exception("Location must be 2 characters only (got {})".format(name))
+
+    parts = prefix.split('.')
+    if len(parts) > 4:
+        raise Exception("Malformed location IPv4 prefix {}".format(prefix))
+    prefix_bytes = b''
+    for part in parts:
+        prefix_bytes += bytes([int(part)])
+    compiler.locations.setdefault(name.decode('ascii'), []).append(prefix_bytes)
+    key = b'\0%' + prefix_bytes
+    value = name
+    yield key, value
+
+# The most addresses a '$' line may cover, so a typo like 10.0.0.0/0 is an
+# error rather than billions of records
+max_range_addresses = 65536
+
+def parseAddressRange(text):
+    """Parse the range of a '$' line: an IPv4 CIDR block (10.1.2.0/24), or
+    first and last addresses (10.1.2.10-10.1.2.99, or 10.1.2.10-99 giving
+    only the last octet of the end). IPv6 ranges are the same, with the
+    addresses as 32 hex digits like in '6' lines. Returns (version, first,
+    last) with the addresses as ints, checking the range has at most
+    max_range_addresses addresses.
+    """
+    version, start, end = parseAddressBounds(text)
+    if end - start + 1 > max_range_addresses:
+        raise Exception("Range {} has {} addresses, more than the {} allowed".format(
+                text, end - start + 1, max_range_addresses))
+    return version, start, end
+
+def parseAddressBounds(text):
+    """parseAddressRange, without the limit on the size of the range"""
+    if '/' in text:
+        base, prefix = text.split('/', 1)
+        if '.' in base:
+            version, bits, start = 4, 32, ipv4_to_u32(base)
+        else:
+            version, bits, start = 6, 128, int.from_bytes(ipv6_to_bytes(base), 'big')
+        prefix = int(prefix)
+        if not (0 <= prefix and prefix <= bits):
+            raise Exception("Bad prefix length /{}".format(prefix))
+        mask = (1 << (bits - prefix)) - 1
+        return version, start & ~mask, start | mask
+    elif '-' in text:
+        first, last = text.split('-', 1)
+        if '.' in first:
+            start = ipv4_to_u32(first)
+            if '.' not in last:
+                last = first.rsplit('.', 1)[0] + '.' + last
+            version, end = 4, ipv4_to_u32(last)
+        else:
+            version = 6
+            start = int.from_bytes(ipv6_to_bytes(first), 'big')
+            end = int.from_bytes(ipv6_to_bytes(last), 'big')
+        if end < start:
+            raise Exception("Range {} ends before it starts".format(text))
+        return version, start, end
+    raise Exception("Bad format for the range/cidr")
+
+@intent('$', [None, None, default_TTL, "0", None], [None, None, int, int16, None])
+def encodeAddressRange(compiler, template, range_, ttl, ttd, loc):
+    # Like an '=' (or '6') line for every address in the range, named by
+    # replacing the '$' in the template with the address (with '-' for '.'
+    # in IPv4 addresses). The records are generated as they're written, so
+    # big pools don't need a line (or a list of records) per host.
+    head, dollar, tail = template.partition('$')
+    if not dollar:
+        raise Exception("Name template {} has no '$'".format(template))
+    version, start, end = parseAddressRange(range_)
+    for i in range(start, end + 1):
+        if version == 4:
+            address = "{}.{}.{}.{}".format(i >> 24, (i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)
+            name = head + address.replace('.', '-') + tail
+            yield make_record(name, RR_TYPE_A, loc, ttl, ttd, U32.pack(i))
+            yield from compiler.makeReverseRecords4(address, name, loc, ttl, ttd)
+        else:
+            address = i.to_bytes(16, 'big')
+            name = head + address.hex() + tail
+            yield make_record(name, RR_TYPE_AAAA, loc, ttl, ttd, address)
+            yield from compiler.makeReverseRecords6(address, name, loc, ttl, ttd)
+
+# The '<' (include) lines of a data file, as bytes
+include_line = re.compile(rb'^<([^\n]*)$', re.M)
+
+class DataSource:
+    """The lines of one or more data files, read one after the other as a
+    single stream. '-' stands for stdin.
+
+    A line starting with '<' includes another file in its place, e.g.
+    '<hosts/team1'. Relative paths are relative to the directory of the file
+    with the include line.
+
+    Remembers where the lines came from, so locate() can turn a line number
+    of the stream (as given to exceptions by Compiler) back into a file and
+    line.
+    """
+    def __init__(self, paths, buffering=1 << 20):
+        self.paths = list(paths)
+        self.buffering = buffering
+        # Every file read so far, including included ones
+        self.files = []
+        # (first line number in the stream, path, line number in the file)
+        # for each run of lines from the same file
+        self.segments = []
+        self.starts = []
+        self.count = 0
+
+    def serial(self):
+        """The timestamp of the newest input, or file included by one, for
+        the default SOA serial. stdin counts as the current time.
+        """
+        times = []
+        seen = set()
+        for path in self.paths:
+            if path == '-':
+                times.append(time.time())
+            else:
+                times.append(os.stat(path).st_mtime)
+                self.includeTimes(path, seen, times)
+        return max(times)
+
+    def includeTimes(self, path, seen, times):
+        """Add the timestamps of the files path includes (and so on) to
+        times. Only the '<' lines are looked at; files that can't be read,
+        and include loops, are left for read() to report.
+        """
+        real = os.path.realpath(path)
+        if real in seen:
+            return
+        seen.add(real)
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    includes = [os.fsdecode(match.group(1).rstrip()) for match in include_line.finditer(m)]
+        except OSError:
+            return
+        base = os.path.dirname(path)
+        for included in includes:
+            if included == '-':
+                times.append(time.time())
+                continue
+            if not os.path.isabs(included):
+                included = os.path.join(base, included)
+            try:
+                times.append(os.stat(included).st_mtime)
+            except OSError:
+                continue
+            self.includeTimes(included, seen, times)
+
+    def __iter__(self):
+        for path in self.paths:
+            yield from self.read(path, ())
+
+    def mark(self, path, fileline):
+        self.starts.append(self.count + 1)
+        self.segments.append((self.count + 1, path, fileline))
+
+    def read(self, path, including, where=None):
+        # including holds the real paths of the files whose '<' lines led
+        # here, so './data' and 'd/../data' are caught as well as 'data',
+        # and where the (path, line) of the '<' line including this file
+        real = path if path == '-' else os.path.realpath(path)
+        if real in including:
+            raise Exception("{} includes itself".format(path))
+        self.files.append(path)
+        if path == '-':
+            f = sys.stdin
+            base = '.'
+        else:
+            try:
+                f = open(path, buffering=self.buffering)
+            except OSError as e:
+                if where is None:
+                    raise
+                raise OSError(e.errno, "{} line {}: can't include {}: {}".format(
+                    where[0], where[1], path, e.strerror)) from None
+            base = os.path.dirname(path)
+        try:
+            self.mark(path, 1)
+            fileline = 0
+            for line in f:
+                fileline += 1
+                if line[:1] == '<':
+                    included = line[1:].rstrip()
+                    if not os.path.isabs(included) and included != '-':
+                        included = os.path.join(base, included)
+                    yield from self.read(included, including + (real,), (path, fileline))
+                    self.mark(path, fileline + 1)
+                    continue
+                self.count += 1
+                yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+    def locate(self, lineno):
+        """Return (path, line in that file) of line lineno of the stream"""
+        i = bisect.bisect_right(self.starts, lineno) - 1
+        if i < 0:
+            return ("input", lineno)
+        start, path, fileline = self.segments[i]
+        return (path, fileline + lineno - start)
+
+# Intents whose lines change the state of the Compiler, so they're always
+# processed, in order, by the Compiler itself
+stateful_intents = {'/', '%'}
+
+# Intents whose lines can make more records than are worth holding at once,
+# so they're generated as they're written: never cached, and never sent to
+# worker processes
+lazy_intents = {'$'}
+
+class Compiler:
+    """Converts data lines into records.
+
+    Holds the state that carries from one line to the next: the '/'
+    sub-delegations, the '%' locations (location name to list of IP
+    prefixes) and the serial for SOA records that don't give one (by
+    default, the current time). A LineCache can be given to reuse the
+    records of lines it has seen before, and a BuildStats to count and time
+    the lines going through records(). With ip6_int False, IPv6 addresses
+    only get PTR records under ip6.arpa, not the obsolete ip6.int.
+    """
+    def __init__(self, serial=None, cache=None, stats=None, ip6_int=True):
+        if serial is None:
+            serial = time.time()
+        self.serial = int(serial)
+        self.cache = cache
+        self.stats = stats
+        self.ip6_int = ip6_int
+        # The number and type (first character) of the line whose records
+        # records() is yielding
+        self.lineno = 0
+        self.linetype = ''
+
+        self.delegates4 = SubDelegations4()
+        self.delegates6 = SubDelegations6()
+        self.locations = {}
+
+    def processLine(self, line):
+        """Return the records (as (key, value) pairs) of one data line"""
+        line = line.rstrip()
+        if len(line) == 0 or line[0] == '#':
+            return ()
+        handler = intents.get(line[0])
+        if handler is None:
+            raise Exception("Unknown record type '{}'".format(line[0]))
+        return handler.process(self, line[1:])
+
+    def process(self, line):
+        """Like processLine, but through the cache if there is one"""
+        if self.cache is not None:
+            return self.cache.process(self, line)
+        return self.processLine(line)
+
+    def records(self, lines, jobs=1):
+        """Yield the records of lines (e.g. an open data file) in order.
+
+        With jobs > 1, the lines are encoded in a pool of that many processes.
+
+        If a line can't be converted, the exception is given a 'lineno'
+        attribute with its line number and, if lines is a DataSource, a
+        'location' attribute with its (path, line in that file).
+        """
+        try:
+            if jobs > 1:
+                yield from self.processParallel(lines, jobs)
+                return
+            process = self.process
+            if self.stats is not None:
+                process = self.stats.timedProcess(process)
+            lineno = 0
+            for line in lines:
+                lineno += 1
+                self.lineno = lineno
+                self.linetype = line[:1]
+                yield from self.lineRecords(process, line, lineno)
+        except Exception as e:
+            if hasattr(e, 'lineno') and hasattr(lines, 'locate'):
+                e.location = lines.locate(e.lineno)
+            raise
+
+    def lineRecords(self, process, line, lineno):
+        """Yield the records of line from process(line), giving any exception
+        a 'lineno' attribute
+        """
+        try:
+            yield from process(line)
+        except Exception as e:
+            e.lineno = lineno
+            raise
+
+    def compile(self, lines, sink, jobs=1):
+        """Convert lines into records (see records()), giving each to
+        sink.add(key, value). Returns the number of records.
+        """
+        count = 0
+        for key, value in self.records(lines, jobs):
+            sink.add(key, value)
+            count += 1
+        return count
+
+    def getSubDelegates4(self, address):
+        return self.delegates4.lookup(address)
+
+    def getSubDelegates6(self, address):
+        return self.delegates6.lookup(address)
+
+    def makeReverseRecords4(self, address, target, loc, ttl, ttd):
+        parts = address.split('.')
+        rparts = list(reversed(parts))
+        i_address = ipv4_to_u32(address)
+        data = name_to_dns(target)
+
+        # do any sub-delegation formats (e.g. DeGroot, RFC2317))
+        did_delegate = False
+        for base, octets in self.getSubDelegates4(i_address):
+            rname = ".".join(rparts[:octets] + [base])
+            yield make_record(rname, RR_TYPE_PTR, loc, ttl, ttd, data)
+            did_delegate = True
+        if not did_delegate:
+            # Do the normal record if we didn't do anything special
+            rname = ".".join(rparts + ['in-addr','arpa'])
+            yield make_record(rname, RR_TYPE_PTR, loc, ttl, ttd, data)
+
+    def makeReverseRecords6(self, address, target, loc, ttl, ttd):
+        # address is the 16 bytes; the reversed nibbles are encoded straight
+        # from them rather than going through a name
+        rlabels = b''.join(map(NIBBLE_LABELS.__getitem__, reversed(address)))
+        value = make_value(RR_TYPE_PTR, loc, ttl, ttd, name_to_dns(target))
+        # PTR record for ip6.arpa, the normal one, or for the sub-delegations
+        # covering the address. The first of those asking for one gets a
+        # CNAME from the normal name (unless it is the same name), as a name
+        # can only have one.
+        arpa = rlabels + IP6_ARPA
+        did_delegate = False
+        linked = False
+        for base, nibbles, cnames in self.getSubDelegates6(address):
+            key = rlabels[:2 * nibbles] + name_to_dns(base)
+            yield key, value
+            if cnames and not linked and key.lower() != arpa:
+                yield arpa, make_value(RR_TYPE_CNAME, loc, ttl, ttd, key)
+                linked = True
+            did_delegate = True
+        if not did_delegate:
+            yield arpa, value
+        # PTR record for ip6.int, to be compatible with old stuff. The
+        # dbndns package does this, presumably from the fefe patch.
+        if self.ip6_int:
+            yield rlabels + IP6_INT, value
+
+    def lineDependencies(self, line):
+        """Return the outside state the records of the given line depend on,
+        as something comparable, or None if the line can't be cached.
+
+        Most lines only depend on their own text. SOA serials default to the
+        serial of the Compiler, and PTR records from '=' and '6' lines depend
+        on the '/' sub-delegations preceding them (and for '6', on whether
+        ip6.int records are made). Lines of stateful intents (e.g.
+        '/') update the Compiler, so they're always processed.
+        """
+        rtype = line[:1]
+        if rtype == '.':
+            return self.serial
+        elif rtype == 'Z':
+            fields = line[1:].rstrip().split(':')
+            if len(fields) < 4 or fields[3] == '':
+                return self.serial
+        elif rtype == '=':
+            fields = line[1:].rstrip().split(':')
+            if len(fields) < 2:
+                return None
+            try:
+                address = ipv4_to_u32(fields[1])
+            except Exception:
+                # Let processLine report the error
+                return None
+            return tuple(self.getSubDelegates4(address))
+        elif rtype == '6':
+            fields = line[1:].rstrip().split(':')
+            if len(fields) < 2:
+                return None
+            try:
+                address = ipv6_to_bytes(fields[1])
+            except Exception:
+                return None
+            return (self.ip6_int, tuple(self.getSubDelegates6(address)))
+        elif rtype in stateful_intents or rtype in lazy_intents:
+            return None
+        return ()
+
+    def processParallel(self, lines, jobs, chunk_size=10000):
+        """Process lines in a pool of worker processes, yielding the records
+        in the same order as processing the lines one at a time would.
+
+        Stateful lines (e.g. '/') affect the lines after them, so they're
+        also processed here as the chunks are read, and each chunk is sent
+        along with the sub-delegations made before it. Lazy lines (e.g. '$')
+        end a chunk and are generated here, in their turn, with the
+        sub-delegations made before them.
+        """
+        setup = (name_cache_size, tuple(loaded_plugins))
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            pending = collections.deque()
+            lineno = 1
+            lines = iter(lines)
+            while True:
+                delegations = tuple(self.delegates4)
+                delegations6 = tuple(self.delegates6)
+                chunk = []
+                lazy = None
+                for line in lines:
+                    if line[:1] in lazy_intents:
+                        lazy = line
+                        break
+                    chunk.append(line)
+                    if line[:1] in stateful_intents:
+                        try:
+                            for record in self.processLine(line):
+                                pass
+                        except Exception as e:
+                            e.lineno = lineno + len(chunk) - 1
+                            raise
+                    if len(chunk) == chunk_size:
+                        break
+                if chunk:
+                    linetypes = [line[:1] for line in chunk]
+                    future = pool.submit(processChunk, self.serial, lineno, chunk, delegations,
+                            delegations6, self.ip6_int, setup)
+                    pending.append((lineno, linetypes, future))
+                    lineno += len(chunk)
+                if lazy is not None:
+                    compiler = Compiler(self.serial, ip6_int=self.ip6_int)
+                    compiler.delegates4 = SubDelegations4(self.delegates4)
+                    compiler.delegates6 = SubDelegations6(self.delegates6)
+                    pending.append((lineno, [lazy[:1]], self.lineRecords(compiler.processLine, lazy, lineno)))
+                    lineno += 1
+                done = not chunk and lazy is None
+                while pending and (len(pending) > 2 * jobs or done):
+                    first, linetypes, records = pending.popleft()
+                    if isinstance(records, concurrent.futures.Future):
+                        records, ends, counts = records.result()
+                        for i, count in enumerate(counts):
+                            worker_name_cache_counts[i] += count
+                    else:
+                        ends = None
+                    if ends is None:
+                        self.lineno = first
+                        self.linetype = linetypes[0]
+                        yield from records
+                        continue
+                    start = 0
+                    for i, end in enumerate(ends):
+                        if end > start:
+                            self.lineno = first + i
+                            self.linetype = linetypes[i]
+                            yield from records[start:end]
+                            start = end
+                if done:
+                    break
+
+def compile(source, sink, options=None):
+    """Convert the data lines from source (any iterable of lines, such as an
+    open file) into records, giving each to sink.add(key, value) (e.g. a
+    CdbWriter, which the caller finishes). options may give the Compiler
+    settings 'serial' and 'cache', and 'jobs' for Compiler.compile.
+
+    Returns the number of records.
+    """
+    options = dict(options or {})
+    jobs = options.pop('jobs', 1)
+    return Compiler(**options).compile(source, sink, jobs)
+
+def recordsFromFile(path, serial=None):
+    """Yield the (key, value) records of a file: a cdb if the name ends in
+    '.cdb', a snapshot if it ends in '.snap', otherwise a data file (or '-' for stdin), which is compiled (with
+    the SOA serial defaulting to the file's timestamp, like tinydns-data.py).
+    """
+    if path.endswith('.cdb') or path.endswith('.snap'):
+        with openDatabase(path) as reader:
+            for key, value in reader:
+                yield bytes(key), bytes(value)
+        return
+    source = DataSource([path])
+    if serial is None:
+        serial = source.serial()
+    yield from Compiler(serial).records(source)
+
+def recordDigest(key, value):
+    h = hashlib.blake2b(U32.pack(len(key)), digest_size=8)
+    h.update(key)
+    h.update(value)
+    return int.from_bytes(h.digest(), 'big')
+
+def recordSortKey(record):
+    """Order records by owner name, type, location and data"""
+    key, value = record
+    if key[:2] == b'\0%':
+        return ('', 0, '', key)
+    type_, loc, ttl, ttd, rdata = decodeValue(value)
+    return (dns_to_name(key)[0].lower(), type_, loc or '', bytes(rdata), ttl, ttd)
+
+def diffRecords(old, new):
+    """Compare two sets of records, given as functions returning an iterator
+    over them (each is read twice). Returns (removed, added), lists of the
+    records only in old and only in new, sorted by recordSortKey. Records
+    are compared as a whole (including TTL, TTD and location), and
+    duplicates count.
+
+    Only an 8 byte hash per distinct record is kept while comparing; the
+    records themselves are only kept for the differences.
+    """
+    counts = {}
+    for key, value in old():
+        digest = recordDigest(key, value)
+        counts[digest] = counts.get(digest, 0) - 1
+    for key, value in new():
+        digest = recordDigest(key, value)
+        counts[digest] = counts.get(digest, 0) + 1
+    changed = {digest: count for digest, count in counts.items() if count != 0}
+    del counts
+
+    removed = []
+    added = []
+    if changed:
+        for records, sign, result in ((old, -1, removed), (new, 1, added)):
+            for key, value in records():
+                digest = recordDigest(key, value)
+                count = changed.get(digest, 0)
+                if count * sign > 0:
+                    changed[digest] = count - sign
+                    result.append((key, value))
+    removed.sort(key=recordSortKey)
+    added.sort(key=recordSortKey)
+    return removed, added
+
+def locationsOverlap(a, b):
+    """Whether records for locations a and b (None for everyone) can be
+    served to the same client
+    """
+    return a is None or b is None or a == b
+
+class Linter:
+    """Checks data lines for problems that don't stop the conversion, in one
+    pass over the lines (see check()) and a few lookups at the end (see
+    finish()):
+
+    * lines that can't be converted at all
+    * records given more than once (e.g. by '=' and '+' lines for the same
+      name and address)
+    * CNAME records at names with other records, or more than one CNAME
+    * CNAME ('C') targets, and PTR ('^') targets lacking an A or AAAA
+      record, that are in one of the zones of the data (the owners of SOA
+      records, leaving out names delegated away by NS records) but don't
+      exist there
+    * glue ('&' and '.' lines) giving a name server an address that the
+      other A records of that name don't have
+
+    Names and records are indexed by their hash rather than kept, so the
+    time taken grows linearly with the number of records, and the memory
+    used by a few dozen bytes per name and record.
+    """
+    def __init__(self, compiler=None):
+        if compiler is None:
+            compiler = Compiler(serial=0)
+        self.compiler = compiler
+        # hash of name -> [(type, location, line of its first record), ...]
+        self.owners = {}
+        # hash of record -> line it first came from
+        self.records = {}
+        # hashes of the names with A records other than glue, and of each
+        # of those names along with the address
+        self.addressed = set()
+        self.addresses = set()
+        # (name, address, line) of each glue A record
+        self.glue = []
+        # (type, target name, line) of each 'C' and '^' line
+        self.targets = []
+        self.apexes = set()
+        self.cuts = set()
+        self.problems = []
+        # The duplicates reported for the line being checked
+        self.reported_line = None
+        self.reported = set()
+
+    def report(self, lineno, message):
+        self.problems.append((lineno, message))
+
+    def check(self, lineno, line):
+        """Convert one line and index its records, reporting (rather than
+        raising) any problems
+        """
+        rtype = line[:1]
+        try:
+            for key, value in self.compiler.processLine(line):
+                self.checkRecord(lineno, rtype, key, value)
+        except Exception as e:
+            self.report(lineno, "can't convert: {}".format(e))
+
+    def checkRecord(self, lineno, rtype, key, value):
+        """Index one record, made by line lineno of type rtype (e.g. from
+        SnapshotReader.records())
+        """
+        if key[:2] == b'\0%':
+            return
+        if lineno != self.reported_line:
+            self.reported_line = lineno
+            self.reported = set()
+        name = key.lower()
+        record = hash((name, value))
+        first = self.records.setdefault(record, lineno)
+        if first != lineno:
+            if record not in self.reported:
+                self.report(lineno, "duplicate of the record from line {}: {}".format(
+                    first, describeRecord(key, value)))
+                self.reported.add(record)
+            return
+        self.index(lineno, rtype, name, value)
+
+    def index(self, lineno, rtype, name, value):
+        type_ = (value[0] << 8) | value[1]
+        if value[2:3] == b'>':
+            loc = value[3:5]
+            rdata = value[RECORD_HEADER_LOC.size:]
+        else:
+            loc = None
+            rdata = value[RECORD_HEADER.size:]
+        owner = hash(name)
+        types = self.owners.get(owner)
+        if types is None:
+            # Most names only have one type, so that's kept without a list
+            self.owners[owner] = (type_, loc, lineno)
+        else:
+            if isinstance(types, tuple):
+                types = self.owners[owner] = [types]
+            known = False
+            for other, other_loc, first in types:
+                if other == type_ and other_loc == loc:
+                    known = True
+                if first == lineno or not locationsOverlap(loc, other_loc):
+                    continue
+                if type_ == RR_TYPE_CNAME or other == RR_TYPE_CNAME:
+                    self.report(lineno, "{} record at {} conflicts with the {} record from line {}".format(
+                        rrTypeName(type_), dns_to_name(name)[0], rrTypeName(other), first))
+                    break
+            if not known:
+                types.append((type_, loc, lineno))
+
+        if type_ == RR_TYPE_SOA:
+            self.apexes.add(name)
+        elif type_ == RR_TYPE_NS:
+            self.cuts.add(name)
+        elif type_ == RR_TYPE_A:
+            if rtype in ('&', '.'):
+                self.glue.append((name, rdata, lineno))
+            else:
+                self.addressed.add(owner)
+                self.addresses.add(hash((name, rdata)))
+        if (rtype == 'C' and type_ == RR_TYPE_CNAME) or (rtype == '^' and type_ == RR_TYPE_PTR):
+            self.targets.append((type_, rdata.lower(), lineno))
+
+    def inOurZones(self, name):
+        """Whether name is in one of the zones, and not delegated away"""
+        pos = 0
+        while pos < len(name):
+            suffix = name[pos:]
+            if suffix in self.apexes:
+                return True
+            if suffix in self.cuts:
+                return False
+            pos += name[pos] + 1
+        return False
+
+    def finish(self):
+        """Report the problems that need all the records, and return every
+        problem as (line, message), in line order
+        """
+        for type_, target, lineno in self.targets:
+            if not self.inOurZones(target):
+                continue
+            types = self.owners.get(hash(target), [])
+            if isinstance(types, tuple):
+                types = [types]
+            types = {other for other, loc, first in types}
+            if type_ == RR_TYPE_CNAME and not types:
+                self.report(lineno, "CNAME target {} doesn't exist".format(dns_to_name(target)[0]))
+            elif type_ == RR_TYPE_PTR and not types & {RR_TYPE_A, RR_TYPE_AAAA}:
+                self.report(lineno, "PTR target {} has no A or AAAA record".format(dns_to_name(target)[0]))
+        for name, address, lineno in self.glue:
+            if hash(name) in self.addressed and hash((name, address)) not in self.addresses:
+                self.report(lineno, "glue for {} gives {}, which none of its other A records do".format(
+                    dns_to_name(name)[0], ipaddress.IPv4Address(address)))
+        self.problems.sort(key=lambda problem: problem[0])
+        return self.problems
+
+def lint(lines):
+    """Check lines (e.g. a DataSource) for problems (see Linter). Returns a
+    list of (line number, message), in line order.
+    """
+    linter = Linter()
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        linter.check(lineno, line)
+    return linter.finish()
+
+def lintRecords(records):
+    """Like lint, for records already made, as (line, type of line, key,
+    value) (e.g. from SnapshotReader.records())
+    """
+    linter = Linter()
+    for lineno, rtype, key, value in records:
+        linter.checkRecord(lineno, rtype, key, value)
+    return linter.finish()
+
+# Change whenever the records some line makes change, so caches of the old
+# records are discarded
+LINE_CACHE_FORMAT = 1
+
+class LineCache:
+    """On-disk cache of the records produced by each line of the data file,
+    keyed by a hash of the line's text.
+
+    Only entries for lines seen during this run are saved, so the cache
+    doesn't grow as lines are removed from the data file. The file starts
+    with a header of what else decides the records (the format, the loaded
+    plugins and ip6_int), and a cache with a different header is ignored.
+    """
+    def __init__(self, path=None, ip6_int=True):
+        """Load the cache from path. Without a path, the cache is only kept
+        in memory (see nextBuild).
+        """
+        self.path = path
+        self.header = (LINE_CACHE_FORMAT, tuple(loaded_plugins), ip6_int)
+        self.old = {}
+        self.new = {}
+        self.hits = 0
+        self.misses = 0
+        if path is None:
+            return
+        try:
+            with open(path, 'rb') as f:
+                header = pickle.load(f)
+                if header != self.header:
+                    print("Ignoring cache {} made by another version or with other options".format(path),
+                            file=sys.stderr)
+                    return
+                self.old = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Ignoring unreadable cache {}: {}".format(path, e), file=sys.stderr)
+
+    def process(self, compiler, line):
+        """Return the records for the line, from the cache if possible"""
+        deps = compiler.lineDependencies(line)
+        if deps is None:
+            return compiler.processLine(line)
+        digest = hashlib.blake2b(line.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
+        entry = self.old.get(digest)
+        if entry is None:
+            entry = self.new.get(digest)
+        if entry is not None and entry[0] == deps:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = (deps, list(compiler.processLine(line)))
+        self.new[digest] = entry
+        return entry[1]
+
+    def nextBuild(self):
+        """Start over with the entries of the build just done, for reuse by
+        the next build in the same process.
+        """
+        self.old = self.new
+        self.new = {}
+
+    def save(self):
+        if self.path is None:
+            return
+        tmppath = self.path + '.tmp'
+        with open(tmppath, 'wb') as f:
+            pickle.dump(self.header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(self.new, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmppath, self.path)
+
+# The (name cache size, plugins) this worker process was set up with
+worker_setup = None
+
+def initWorker(cache_size, plugins):
+    """Set up a worker process like the parent process, the first time it's
+    given a chunk. (ProcessPoolExecutor only takes an initializer from
+    Python 3.7 on.)
+    """
+    global worker_setup
+    if worker_setup == (cache_size, plugins):
+        return
+    worker_setup = (cache_size, plugins)
+    setNameCacheSize(cache_size)
+    for plugin in plugins:
+        if plugin not in loaded_plugins:
+            loadPlugin(plugin)
+
+def processChunk(serial, lineno, lines, delegations, delegations6=(), ip6_int=True, setup=None):
+    """Process a chunk of lines in a worker process, starting with the given
+    IPv4 and IPv6 sub-delegations (those made by '/' lines before the chunk).
+    setup is the (name cache size, plugins) for initWorker.
+
+    Returns the records of all lines in the chunk in order, for each line
+    the number of records up to the end of it, and the name cache counts
+    (see nameCacheCounts) of the chunk. If a line fails, the exception is
+    given a 'lineno' attribute with its line number.
+    """
+    if setup is not None:
+        initWorker(*setup)
+    before = nameCacheCounts()
+    compiler = Compiler(serial, ip6_int=ip6_int)
+    compiler.delegates4 = SubDelegations4(delegations)
+    compiler.delegates6 = SubDelegations6(delegations6)
+    records = []
+    ends = array.array('I')
+    for line in lines:
+        try:
+            records.extend(compiler.processLine(line))
+        except Exception as e:
+            e.lineno = lineno
+            raise
+        ends.append(len(records))
+        lineno += 1
+    counts = tuple(after - was for after, was in zip(nameCacheCounts(), before))
+    return records, ends, counts
+
+class BuildStats:
+    """Where the time and output of a build go: lines, records, bytes and
+    time spent producing the records for each kind of data line (its first
+    character), records and bytes for each record type, calls and time
+    spent in some of the functions the intents use, and time spent writing.
+
+    Only covers what's done in this process, so not lines encoded by other
+    processes (with jobs > 1).
+    """
+    # Module level functions (and Compiler methods) timed by instrument()
+    timed_functions = ['name_to_dns', 'labels_to_dns', 'deescape_text', 'getSubDelegates4',
+            'getSubDelegates6']
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        self.lines = {}
+        self.types = {}
+        self.functions = {name: [0, 0.0] for name in self.timed_functions}
+        self.write_seconds = 0.0
+        self.finish_seconds = 0.0
+        self.originals = {}
+
+    def timeFunction(self, name, function):
+        counts = self.functions[name]
+        clock = time.perf_counter
+        def timed(*args):
+            start = clock()
+            try:
+                return function(*args)
+            finally:
+                counts[0] += 1
+                counts[1] += clock() - start
+        return timed
+
+    def instrument(self):
+        """Replace the functions named in timed_functions with timed
+        versions, until restore()
+        """
+        module = sys.modules[__name__]
+        for name in self.timed_functions:
+            owner = Compiler if hasattr(Compiler, name) else module
+            original = getattr(owner, name)
+            self.originals[name] = (owner, original)
+            setattr(owner, name, self.timeFunction(name, original))
+
+    def restore(self):
+        for name, (owner, original) in self.originals.items():
+            setattr(owner, name, original)
+        self.originals = {}
+
+    def timedProcess(self, process):
+        """Wrap process (e.g. Compiler.process) to count and time the lines
+        and records going through it. Only the time spent producing the
+        records counts, not that spent by whoever is taking them.
+        """
+        clock = time.perf_counter
+        def timed(line):
+            kind = line[:1]
+            counts = self.lines.get(kind)
+            if counts is None:
+                counts = self.lines[kind] = [0, 0, 0, 0.0]
+            counts[0] += 1
+            start = clock()
+            try:
+                for key, value in process(line):
+                    counts[1] += 1
+                    counts[2] += 8 + len(key) + len(value)
+                    counts[3] += clock() - start
+                    yield key, value
+                    start = clock()
+            finally:
+                counts[3] += clock() - start
+        return timed
+
+    def sink(self, out):
+        """Wrap a sink (e.g. a CdbWriter) to count and time the records
+        given to it
+        """
+        return StatsSink(self, out)
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    def peakMemory(self):
+        """The most memory this process has used, in KiB, or None if that
+        can't be found
+        """
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            # In bytes there
+            peak //= 1024
+        return peak
+
+    def summary(self):
+        """The statistics as a dict (of dicts), for JSON"""
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            'seconds': end - self.start,
+            'peak_memory_kib': self.peakMemory(),
+            'lines': {kind: {'lines': lines, 'records': records, 'bytes': size, 'seconds': seconds}
+                for kind, (lines, records, size, seconds) in sorted(self.lines.items())},
+            'types': {(rrTypeName(type_) if type_ else 'location'): {'records': records, 'bytes': size}
+                for type_, (records, size) in sorted(self.types.items())},
+            'functions': {name: {'calls': calls, 'seconds': seconds}
+                for name, (calls, seconds) in self.functions.items()},
+            'writer': {'add_seconds': self.write_seconds, 'finish_seconds': self.finish_seconds},
+            }
+
+    def report(self, stream, format='text'):
+        summary = self.summary()
+        if format == 'json':
+            json.dump(summary, stream, indent=1, sort_keys=True)
+            stream.write('\n')
+            return
+        print("{:<6} {:>10} {:>10} {:>12} {:>9}".format('line', 'lines', 'records', 'bytes', 'seconds'), file=stream)
+        for kind, counts in summary['lines'].items():
+            print("{:<6} {lines:>10} {records:>10} {bytes:>12} {seconds:>9.3f}".format(
+                repr(kind) if kind in ('', ' ') else kind, **counts), file=stream)
+        print(file=stream)
+        print("{:<10} {:>10} {:>12}".format('type', 'records', 'bytes'), file=stream)
+        for type_, counts in summary['types'].items():
+            print("{:<10} {records:>10} {bytes:>12}".format(type_, **counts), file=stream)
+        print(file=stream)
+        print("{:<18} {:>10} {:>9}".format('function', 'calls', 'seconds'), file=stream)
+        for name, counts in summary['functions'].items():
+            print("{:<18} {calls:>10} {seconds:>9.3f}".format(name, **counts), file=stream)
+        print(file=stream)
+        print("writing: {add_seconds:.3f}s adding records, {finish_seconds:.3f}s finishing".format(
+            **summary['writer']), file=stream)
+        message = "total: {:.3f}s".format(summary['seconds'])
+        if summary['peak_memory_kib'] is not None:
+            message += ", peak memory {:.1f} MiB".format(summary['peak_memory_kib'] / 1024)
+        print(message, file=stream)
+
+class StatsSink:
+    """A sink passing records on to another, for BuildStats"""
+    def __init__(self, stats, out):
+        self.stats = stats
+        self.out = out
+        self.counts = {}
+
+    def add(self, key, value):
+        start = time.perf_counter()
+        self.out.add(key, value)
+        self.stats.write_seconds += time.perf_counter() - start
+        # Type 0 for '%' records
+        type_ = 0 if key[:2] == b'\0%' else (value[0] << 8) | value[1]
+        counts = self.stats.types.get(type_)
+        if counts is None:
+            counts = self.stats.types[type_] = [0, 0]
+        counts[0] += 1
+        counts[1] += 8 + len(key) + len(value)
+
+    def finish(self):
+        start = time.perf_counter()
+        self.out.finish()
+        self.stats.finish_seconds += time.perf_counter() - start
+        self.counts = getattr(self.out, 'counts', {})
+
+    def abort(self):
+        self.out.abort()
+
+def describeErrorLocation(e):
+    """Where the line that raised e (with the 'lineno' set by Compiler) came from"""
+    if hasattr(e, 'location'):
+        return "{} line {}".format(*e.location)
+    return "input line {}".format(e.lineno)
+
+def isSnapshot(inputs):
+    return len(inputs) == 1 and inputs[0].endswith('.snap')
+
+def checkData(source):
+    """Print the problems lint() finds in source (a DataSource or a
+    SnapshotReader). Returns their number.
+    """
+    if isinstance(source, SnapshotReader):
+        problems = lintRecords(source.records())
+    else:
+        problems = lint(source)
+    for lineno, message in problems:
+        print("{} line {}: {}".format(*source.locate(lineno), message))
+    sys.stdout.flush()
+    return len(problems)
+
+def outputName(args):
+    """What build() writes for args, for messages"""
+    if args.pdns:
+        return args.pdns
+    if args.zones:
+        return "zone files in {}".format(args.zones)
+    if args.text:
+        return "stdout"
+    if args.shards:
+        return "{} shards of {}".format(args.shards, args.output)
+    if args.split_locations:
+        return "{} and its location databases".format(args.output)
+    return args.output
+
+def build(args, cache=None):
+    """Convert the inputs into the output selected by args. Returns the number
+    of records written and the list of files read (including any included
+    ones). If the build fails, the exception is given a 'files' attribute
+    with the files read so far.
+    """
+    stats = BuildStats() if args.stats else None
+    if isSnapshot(args.inputs):
+        source = SnapshotReader(args.inputs[0])
+        files = [args.inputs[0]]
+        compiler = None
+    else:
+        source = DataSource(args.inputs)
+        files = source.files
+        compiler = Compiler(serial=source.serial(), cache=cache, stats=stats, ip6_int=not args.no_ip6_int)
+    if args.pdns:
+        out = PowerDnsWriter(args.pdns, location=args.location)
+    elif args.zones:
+        out = ZoneFileWriter(args.zones, format=args.zone_format, location=args.location, jobs=args.jobs)
+    elif args.shards:
+        out = ZoneSharder(args.output, args.shards, by=args.shard_by, text=args.text, jobs=args.jobs)
+    elif args.split_locations:
+        out = LocationSplitter(args.output, text=args.text)
+    elif args.text:
+        out = CdbTextWriter(sys.stdout.buffer)
+    else:
+        out = CdbWriter(args.output)
+    if args.dedupe:
+        dedup = out = DedupSink(out, memory=args.dedupe_memory << 20,
+                directory=os.path.dirname(os.path.abspath(args.output)))
+    if args.snapshot:
+        out = TeeSink(out, SnapshotWriter(snapshotPath(args.output), compiler, source))
+    if stats is not None:
+        out = stats.sink(out)
+        stats.instrument()
+    try:
+        try:
+            if compiler is None:
+                count = 0
+                for key, value in source:
+                    out.add(key, value)
+                    count += 1
+            else:
+                count = compiler.compile(source, out, args.jobs)
+        except BaseException as e:
+            out.abort()
+            if hasattr(e, 'lineno'):
+                print("Error encountered while processing {}:".format(describeErrorLocation(e)), file=sys.stderr)
+            raise
+        out.finish()
+    except BaseException as e:
+        e.files = files
+        raise
+    finally:
+        if stats is not None:
+            stats.restore()
+        if compiler is None:
+            source.close()
+    if args.dedupe:
+        print("Removed {} duplicate records".format(dedup.duplicates), file=sys.stderr)
+    if stats is not None:
+        stats.finish()
+        stats.report(sys.stderr, args.stats_format)
+    if args.verbose and (args.split_locations or args.shards or args.pdns or args.zones):
+        for path, written in out.counts.items():
+            print("{}: {} records".format(path, written), file=sys.stderr)
+    if cache is not None:
+        cache.save()
+    return count, files
+
+def osErrorMessage(e):
+    """The message for an OSError, e.g. "data: No such file or directory",
+    without the errno that str(e) starts with
+    """
+    if e.filename is not None:
+        return "{}: {}".format(e.filename, e.strerror)
+    return e.strerror or str(e)
+
+def fileSignature(path):
+    """Something that changes whenever the file is changed or replaced"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class FileWatcher:
+    """Waits for changes to a set of files.
+
+    Uses inotify (through libc) on the directories holding the files, so
+    editors that replace the file are noticed too, or falls back to polling
+    if inotify isn't available. Either way, whether a file changed is
+    decided by comparing its fileSignature.
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    def __init__(self, paths, poll_interval=1.0):
+        self.paths = []
+        self.poll_interval = poll_interval
+        self.signatures = {}
+        self.directories = set()
+        self.fd = None
+        try:
+            import ctypes
+            import ctypes.util
+            self.ctypes = ctypes
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            # No libc, or no inotify (not Linux)
+            print("inotify unavailable ({}), polling every {}s".format(e, poll_interval), file=sys.stderr)
+        self.watchPaths(paths)
+
+    def watchPaths(self, paths):
+        """Watch these files (and no longer any others). Files not watched
+        before are compared with how they are now.
+        """
+        self.paths = list(paths)
+        self.signatures = {path: self.signatures[path] if path in self.signatures else fileSignature(path)
+                for path in self.paths}
+        if self.fd is None:
+            return
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        for directory in set(os.path.dirname(os.path.abspath(path)) for path in self.paths) - self.directories:
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+                # e.g. out of watches
+                error = OSError(self.ctypes.get_errno(), "inotify_add_watch failed on {}".format(directory))
+                print("{}, polling every {}s".format(error, self.poll_interval), file=sys.stderr)
+                os.close(self.fd)
+                self.fd = None
+                return
+            self.directories.add(directory)
+
+    def changed(self):
+        """Return whether any file changed since the last call"""
+        changed = False
+        for path in self.paths:
+            signature = fileSignature(path)
+            if signature != self.signatures[path]:
+                self.signatures[path] = signature
+                changed = True
+        return changed
+
+    def wait(self, timeout=None):
+        """Wait until something might have changed, or timeout seconds"""
+        if self.fd is None:
+            if timeout is None:
+                timeout = self.poll_interval
+            time.sleep(min(timeout, self.poll_interval))
+            return
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # Only used as a wake-up; drain the events
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def waitForChange(self, debounce):
+        """Wait for a change, and then until there are no further changes for
+        debounce seconds (so a burst of edits causes a single rebuild).
+        """
+        while not self.changed():
+            self.wait()
+        quiet_since = time.monotonic()
+        while True:
+            remaining = debounce - (time.monotonic() - quiet_since)
+            if remaining <= 0:
+                return
+            self.wait(remaining)
+            if self.changed():
+                quiet_since = time.monotonic()
+
+def watch(args, cache):
+    """Rebuild whenever an input (or a file it includes) changes, until
+    interrupted
+    """
+    watcher = FileWatcher(args.inputs, poll_interval=args.poll_interval)
+    output = outputName(args)
+    while True:
+        start = time.monotonic()
+        files = args.inputs
+        try:
+            count, files = build(args, cache)
+        except Exception as e:
+            # Still watch the files that were read, so fixing an included
+            # file triggers a rebuild
+            files = getattr(e, 'files', files)
+            message = osErrorMessage(e) if isinstance(e, OSError) else e
+            print("Build failed, keeping the previous {}: {}".format(output, message), file=sys.stderr, flush=True)
+        else:
+            message = "Built {} ({} records) in {:.3f}s".format(output, count, time.monotonic() - start)
+            if cache is not None:
+                message += " ({} lines reused, {} encoded)".format(cache.hits, cache.misses)
+            print(message, file=sys.stderr, flush=True)
+        finally:
+            watcher.watchPaths(files)
+        if cache is not None:
+            cache.nextBuild()
+            cache.hits = cache.misses = 0
+        watcher.waitForChange(args.debounce)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert tinydns 'data' into a cdb database")
+    parser.add_argument('inputs', nargs='*', default=['data'], metavar='INPUT',
+            help="data files to read, one after the other ('-' for stdin; default: data)")
+    parser.add_argument('-o', '--output', default='data.cdb',
+            help="cdb file to write (default: %(default)s)")
+    parser.add_argument('--text', action='store_true',
+            help="write the cdbmake text format to stdout instead, for piping into cdbmake or 'cdb -c'")
+    parser.add_argument('--snapshot', action='store_true',
+            help="also save the records in a snapshot next to the output (e.g. data.snap), which can be given "
+                "as the input instead of data files to write the output again without compiling")
+    parser.add_argument('--lint', action='store_true',
+            help="check the inputs for conflicting, duplicate and dangling records instead of writing anything")
+    parser.add_argument('--split-locations', action='store_true',
+            help="write one database per '%%' location (e.g. data.ab.cdb) with its records and those for everyone, "
+                "leaving only the records for everyone in the output (with --text, the databases are in the text format)")
+    parser.add_argument('--shards', type=int, metavar='N',
+            help="split the output into N databases (e.g. data.shard03.cdb) and a manifest listing them (data.manifest.json)")
+    parser.add_argument('--shard-by', choices=('zone', 'name'), default='zone',
+            help="with --shards, keep the names of each zone together, or place each name on its own (default: %(default)s)")
+    parser.add_argument('--pdns', metavar='FILE',
+            help="write a PowerDNS gsqlite3 database to FILE instead of a cdb database")
+    parser.add_argument('--zones', metavar='DIR',
+            help="write a file per zone into DIR (e.g. DIR/example.com.zone) instead of a cdb database")
+    parser.add_argument('--zone-format', choices=('zone', 'axfr'), default='zone',
+            help="with --zones, write zone files, or AXFR responses as sent over TCP (default: %(default)s)")
+    parser.add_argument('--location', metavar='LOC',
+            help="with --pdns or --zones, include the records for location LOC (by default, only records for everyone are written)")
+    parser.add_argument('--dedupe', action='store_true',
+            help="leave out records repeated exactly (same name, type and data), sorting the records by name")
+    parser.add_argument('--dedupe-memory', type=int, default=64, metavar='MB',
+            help="with --dedupe, how much memory to sort the records in before spilling them to disk (default: %(default)s)")
+    parser.add_argument('--no-ip6-int', action='store_true',
+            help="leave out the obsolete ip6.int PTR records of '6' lines, only making the ip6.arpa ones")
+    parser.add_argument('--cache', metavar='FILE',
+            help="keep the records of each line in FILE, and only re-encode lines that changed since the last run")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help="number of processes to encode lines with (default: %(default)s)")
+    parser.add_argument('--name-cache-size', type=int, default=name_cache_size,
+            help="number of encoded domain names to keep for reuse (default: %(default)s)")
+    parser.add_argument('--plugin', action='append', default=[],
+            help="load a module (or .py file) adding intent types; may be given more than once")
+    parser.add_argument('--watch', action='store_true',
+            help="keep running, and rebuild whenever an input changes")
+    parser.add_argument('--debounce', type=float, default=1.0, metavar='SECONDS',
+            help="with --watch, wait until the inputs have been unchanged this long before rebuilding (default: %(default)s)")
+    parser.add_argument('--poll-interval', type=float, default=1.0, metavar='SECONDS',
+            help="with --watch, how often to check the inputs if inotify isn't available (default: %(default)s)")
+    parser.add_argument('--stats', action='store_true',
+            help="report on stderr where the time and output of the build went, by type of line and record")
+    parser.add_argument('--stats-format', choices=('text', 'json'), default='text',
+            help="with --stats, the format of the report (default: %(default)s)")
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help="report cache statistics on stderr at the end")
+    args = parser.parse_args()
+    if args.jobs > 1 and args.cache:
+        parser.error("--cache can't be used with --jobs")
+    if args.shards is not None and args.shards < 1:
+        parser.error("--shards must be at least 1")
+    if args.shards and args.split_locations:
+        parser.error("--shards can't be used with --split-locations")
+    if args.dedupe_memory < 1:
+        parser.error("--dedupe-memory must be at least 1")
+    if args.pdns and args.zones:
+        parser.error("--pdns can't be used with --zones")
+    if (args.pdns or args.zones) and (args.text or args.shards or args.split_locations):
+        parser.error("--{} can't be used with --text, --shards or --split-locations".format('pdns' if args.pdns else 'zones'))
+    if args.location and not (args.pdns or args.zones):
+        parser.error("--location needs --pdns or --zones")
+    if any(path.endswith('.snap') for path in args.inputs) and not isSnapshot(args.inputs):
+        parser.error("a snapshot must be the only input")
+    if args.snapshot and isSnapshot(args.inputs):
+        parser.error("--snapshot needs data files as inputs")
+    if args.no_ip6_int and isSnapshot(args.inputs):
+        parser.error("--no-ip6-int needs data files as inputs")
+    if args.stats and args.jobs > 1:
+        parser.error("--stats can't be used with --jobs")
+    if args.lint and args.watch:
+        parser.error("--lint can't be used with --watch")
+    if args.watch and args.text:
+        parser.error("--watch can't be used with --text")
+    if args.watch and '-' in args.inputs:
+        parser.error("--watch can't be used with stdin")
+    if args.name_cache_size != name_cache_size:
+        setNameCacheSize(args.name_cache_size)
+    for plugin in args.plugin:
+        loadPlugin(plugin)
+
+    try:
+        if args.lint:
+            if isSnapshot(args.inputs):
+                with SnapshotReader(args.inputs[0]) as snapshot:
+                    problems = checkData(snapshot)
+            else:
+                problems = checkData(DataSource(args.inputs))
+            if problems:
+                sys.exit(1)
+            return
+
+        if args.cache:
+            cache = LineCache(args.cache, ip6_int=not args.no_ip6_int)
+        elif args.watch and args.jobs == 1:
+            # Keep the records of the previous build in memory
+            cache = LineCache(ip6_int=not args.no_ip6_int)
+        else:
+            cache = None
+
+        if args.watch:
+            try:
+                watch(args, cache)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        build(args, cache)
+        if args.verbose:
+            if cache is not None:
+                print("line cache: {} hits, {} misses".format(cache.hits, cache.misses), file=sys.stderr)
+            print(nameCacheStats(), file=sys.stderr)
+    except OSError as e:
+        # e.g. a missing input or include, or an output directory that
+        # doesn't exist; not worth a traceback
+        print("{}: error: {}".format(parser.prog, osErrorMessage(e)), file=sys.stderr)
+        sys.exit(1)